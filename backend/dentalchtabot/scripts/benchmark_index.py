@@ -0,0 +1,124 @@
+"""
+Compare FAISS index configurations against the exact flat index.
+
+For each configuration reports recall@k (overlap with IndexFlatL2's top k),
+p50/p99 single-query search latency, build time and index memory.
+
+Usage (from this folder):
+    python benchmark_index.py                      # embeddings.pkl from embed.py
+    python benchmark_index.py --synthetic 200000   # random vectors at library scale
+    python benchmark_index.py --json report.json
+"""
+import time
+import json
+import argparse
+import numpy as np
+
+from store import load_data, build_index, set_search_params, index_memory_bytes, default_nlist
+
+# (index_type, build params, list of search params to sweep)
+CONFIGURATIONS = [
+    ("flat", {}, [{}]),
+    ("hnsw", {"hnsw_m": 16}, [{"ef_search": ef} for ef in (16, 64, 128)]),
+    ("hnsw", {"hnsw_m": 32}, [{"ef_search": ef} for ef in (16, 64, 128)]),
+    ("ivf-flat", {}, [{"nprobe": nprobe} for nprobe in (1, 8, 32)]),
+    ("ivf-pq", {"pq_m": 16}, [{"nprobe": nprobe} for nprobe in (1, 8, 32)]),
+    ("ivf-pq", {"pq_m": 32}, [{"nprobe": nprobe} for nprobe in (1, 8, 32)]),
+]
+
+# ------------------------------
+# 1️⃣ Data & Queries
+# ------------------------------
+def load_vectors(synthetic=0, dim=768, seed=0):
+    """Saved embeddings, or random unit vectors when synthetic > 0."""
+    if synthetic:
+        rng = np.random.default_rng(seed)
+        vectors = rng.standard_normal((synthetic, dim)).astype("float32")
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    _, embeddings = load_data()
+    return embeddings
+
+def make_queries(vectors, num_queries, noise=0.05, seed=1):
+    """Perturbed copies of stored vectors, so a query is near but not equal to a document."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    scale = noise * float(np.linalg.norm(vectors, axis=1).mean()) / np.sqrt(vectors.shape[1])
+    return (vectors[picks] + rng.standard_normal((len(picks), vectors.shape[1])) * scale).astype("float32")
+
+# ------------------------------
+# 2️⃣ Measurements
+# ------------------------------
+def recall_at_k(found, truth):
+    """Fraction of the exact top k present in the approximate top k."""
+    hits = sum(len(set(row[row != -1]) & set(true_row)) for row, true_row in zip(found, truth))
+    return hits / truth.size
+
+def search_latencies_ms(index, queries, k):
+    """Search one query at a time, as the chat endpoint does."""
+    latencies = []
+    results = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, indices = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(indices[0])
+    return np.array(latencies), np.array(results)
+
+def run_benchmark(vectors, queries, k=3, configurations=CONFIGURATIONS):
+    exact = build_index(vectors, index_type="flat")
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type, build_params, search_sweep in configurations:
+        start = time.perf_counter()
+        try:
+            index = build_index(vectors, index_type=index_type, **build_params)
+        except ValueError as e:
+            print(f"⚠️ Skipping {index_type} {build_params}: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        memory_mb = index_memory_bytes(index) / 1e6
+
+        for search_params in search_sweep:
+            set_search_params(index, **search_params)
+            latencies, found = search_latencies_ms(index, queries, k)
+            rows.append({
+                "index": index_type,
+                "params": {**build_params, **search_params},
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "build_s": round(build_s, 2),
+                "memory_mb": round(memory_mb, 2),
+            })
+    return rows
+
+def print_report(rows, k):
+    columns = [f"recall@{k}", "p50_ms", "p99_ms", "build_s", "memory_mb"]
+    print(f"{'index':<10}{'params':<34}" + "".join(f"{column:>12}" for column in columns))
+    for row in rows:
+        params = ", ".join(f"{name}={value}" for name, value in row["params"].items()) or "-"
+        print(f"{row['index']:<10}{params:<34}" + "".join(f"{row[column]:>12}" for column in columns))
+
+# ------------------------------
+# 3️⃣ Main Execution
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency/memory benchmark of FAISS index types")
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark N random vectors instead of embeddings.pkl")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.synthetic, args.dim)
+    queries = make_queries(vectors, args.queries)
+    print(f"✅ {len(vectors)} vectors, {len(queries)} queries, default nlist={default_nlist(len(vectors))}")
+
+    rows = run_benchmark(vectors, queries, k=args.k)
+    print_report(rows, args.k)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Report saved to {args.json}")
@@ -0,0 +1,107 @@
+import re
+import math
+import time
+from collections import Counter, defaultdict
+import numpy as np
+
+# Lowercased words and codes; keeps "0.12%", "d2740" and "k02.9" as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*%?")
+
+# A single identifier-like term, e.g. "D2740", "K02.9", "0.12%"
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z]{0,4}[-.]?\d[\w.\-/%]*$")
+
+# Reciprocal rank fusion constant from the original RRF paper
+RRF_K = 60
+
+# ------------------------------
+# 1️⃣ Tokenize
+# ------------------------------
+def tokenize(text):
+    """Split text into lowercased BM25 terms."""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+def looks_like_identifier(query):
+    """True for queries such as a procedure code or a dose that only lexical search can match."""
+    return bool(IDENTIFIER_PATTERN.match(query.strip()))
+
+# ------------------------------
+# 2️⃣ Inverted Index
+# ------------------------------
+class BM25Index:
+    """
+    Okapi BM25 over the chunk texts, with an in-memory inverted index
+
+    ``doc_ids`` are the chunk IDs, so results can be looked up in the same
+    chunk store and fused with FAISS results.
+    """
+
+    def __init__(self, doc_ids, postings, doc_lengths, k1=1.5, b=0.75):
+        self.doc_ids = np.asarray(doc_ids, dtype="int64")
+        self.postings = postings  # term -> (doc rows int32, term frequencies float32)
+        self.doc_lengths = np.asarray(doc_lengths, dtype="float32")
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        self.k1 = k1
+        self.b = b
+        self.build_time_s = None
+
+    @classmethod
+    def build(cls, text_chunks, doc_ids, k1=1.5, b=0.75):
+        """Build the index from a chunk store (or dict/list) and the chunk IDs to cover."""
+        start = time.perf_counter()
+        rows = defaultdict(list)
+        frequencies = defaultdict(list)
+        doc_lengths = []
+        for row, chunk_id in enumerate(doc_ids):
+            terms = tokenize(text_chunks[int(chunk_id)])
+            doc_lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                rows[term].append(row)
+                frequencies[term].append(count)
+
+        postings = {term: (np.array(rows[term], dtype="int32"), np.array(frequencies[term], dtype="float32"))
+                    for term in rows}
+        index = cls(doc_ids, postings, doc_lengths, k1, b)
+        index.build_time_s = round(time.perf_counter() - start, 3)
+        return index
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def idf(self, term):
+        doc_freq = len(self.postings[term][0]) if term in self.postings else 0
+        return math.log(1 + (len(self.doc_ids) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, k=3):
+        """Return [(chunk ID, score)] of the k best chunks; chunks matching no term are left out."""
+        scores = np.zeros(len(self.doc_ids), dtype="float32")
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            rows, tf = self.postings[term]
+            scores[rows] += self.idf(term) * tf * (self.k1 + 1) / (tf + length_norm[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(self.doc_ids[row]), float(scores[row])) for row in matched]
+
+    def stats(self):
+        return {
+            "documents": len(self.doc_ids),
+            "terms": len(self.postings),
+            "avg_length": round(self.avg_length, 1),
+            "build_time_s": self.build_time_s,
+        }
+
+# ------------------------------
+# 3️⃣ Rank Fusion
+# ------------------------------
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuse ranked lists of chunk IDs; returns [(chunk ID, fused score)] best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,107 @@
+import os
+import re
+
+# Prompt budget: retrieved context is cut to CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKENS", "1200"))
+DEDUP_THRESHOLD = float(os.environ.get("CHAT_DEDUP_THRESHOLD", "0.8"))  # Jaccard similarity of word shingles
+SHINGLE_SIZE = 3
+
+# Rough tokens per character for text without a tokenizer (~4 characters per token for English)
+CHARS_PER_TOKEN = 4
+
+# ------------------------------
+# 1️⃣ Token Counting
+# ------------------------------
+def count_tokens(text, tokenizer=None):
+    """Tokens in text: the embedding model's tokenizer when given, else a character estimate."""
+    if not text:
+        return 0
+    if tokenizer is not None:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+def truncate_to_tokens(text, max_tokens, tokenizer=None):
+    """Cut text to at most max_tokens tokens, at a word boundary where possible."""
+    if count_tokens(text, tokenizer) <= max_tokens:
+        return text
+    words = re.findall(r"\S+\s*", text)
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens("".join(words[:middle]), tokenizer) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return "".join(words[:low]).rstrip()
+
+# ------------------------------
+# 2️⃣ Near-Duplicate Detection
+# ------------------------------
+def shingles(text, size=SHINGLE_SIZE):
+    """Set of lowercased word n-grams of a chunk."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+# ------------------------------
+# 3️⃣ Context Builder
+# ------------------------------
+def chunk_score(chunk):
+    """Higher is better: fused RRF score, else BM25 score, else negative FAISS distance."""
+    if chunk.get("rrf") is not None:
+        return chunk["rrf"]
+    if chunk.get("bm25") is not None:
+        return chunk["bm25"]
+    return -chunk.get("distance", 0.0)
+
+def build_context(chunks, budget=CONTEXT_TOKEN_BUDGET, max_chunks=None,
+                  dedup_threshold=DEDUP_THRESHOLD, tokenizer=None, block_overhead=12):
+    """
+    Pick the chunks that go into the prompt
+
+    Chunks are taken best score first; a chunk whose shingles overlap an
+    already chosen one by ``dedup_threshold`` or more is dropped, and so is
+    one that no longer fits the token budget (smaller ones after it may still
+    fit). The best chunk is always kept, truncated if it alone exceeds the
+    budget. ``block_overhead`` accounts for the "[n] (citation)" header.
+
+    Returns (chosen chunks in score order, stats).
+    """
+    chosen, chosen_shingles = [], []
+    duplicates = over_budget = 0
+    used = 0
+    for chunk in sorted(chunks, key=chunk_score, reverse=True):
+        if max_chunks and len(chosen) >= max_chunks:
+            break
+        chunk_shingles = shingles(chunk["text"])
+        if any(jaccard(chunk_shingles, other) >= dedup_threshold for other in chosen_shingles):
+            duplicates += 1
+            continue
+
+        tokens = count_tokens(chunk["text"], tokenizer) + block_overhead
+        if used + tokens > budget:
+            if chosen:
+                over_budget += 1
+                continue
+            # Never send an empty context: keep the start of the best chunk
+            chunk = {**chunk, "text": truncate_to_tokens(chunk["text"], max(budget - block_overhead, 1), tokenizer),
+                     "truncated": True}
+            tokens = budget
+
+        chosen.append(chunk)
+        chosen_shingles.append(chunk_shingles)
+        used += tokens
+
+    stats = {
+        "candidates": len(chunks),
+        "chunks": len(chosen),
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "context_tokens": used,
+        "budget": budget,
+    }
+    return chosen, stats
@@ -1,62 +1,323 @@
 import os
+import re
+import json
+import time
 import pickle
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import faiss
 import numpy as np
 from tqdm import tqdm
 from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer
+
+from store import INDEX_TYPE, build_index, update_index, save_index, load_vectors, write_vectors, ChunkStore, ChunkWriter
+
+# Files written next to this script and read by store.py / query.py
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PDF_FOLDER = os.path.join(SCRIPT_DIR, "..", "sources", "resources")
+TEXT_FILE = os.path.join(SCRIPT_DIR, "chunks.bin")
+EMB_FILE = os.path.join(SCRIPT_DIR, "embeddings.npy")
+INDEX_FILE = os.path.join(SCRIPT_DIR, "faiss_index.bin")
+MANIFEST_FILE = os.path.join(SCRIPT_DIR, "manifest.json")
+
+# Streaming pipeline settings
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.environ.get("INGEST_PAGES_PER_TASK", "16"))
+EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "64"))
+
+# Chunking: windows of CHUNK_TOKENS tokens overlapping by CHUNK_OVERLAP; shorter pages than MIN_CHUNK_TOKENS are skipped
+CHUNK_TOKENS = int(os.environ.get("INGEST_CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "32"))
+MIN_CHUNK_TOKENS = int(os.environ.get("INGEST_MIN_CHUNK_TOKENS", "8"))
 
 # ------------------------------
 # 1️⃣ Extract Text from Multiple PDFs
 # ------------------------------
+def extract_text_from_pdf(pdf_path):
+    """Extract the text of every page of one PDF."""
+    pdf_reader = PdfReader(pdf_path)
+    return [page.extract_text() for page in pdf_reader.pages]
+
+def count_pages(pdf_path):
+    return len(PdfReader(pdf_path).pages)
+
+def extract_page_range(pdf_path, start, stop):
+    """Extract pages [start, stop) of one PDF; runs in a worker process."""
+    pdf_reader = PdfReader(pdf_path)
+    return [(page_no, pdf_reader.pages[page_no].extract_text() or "") for page_no in range(start, stop)]
+
+def stream_pages(pdf_paths, workers=INGEST_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    Yield (pdf_path, page_no, text) for every page, in order.
+
+    Page ranges are extracted in a process pool with at most two tasks per
+    worker in flight, so memory is bounded by that window rather than by
+    the size of the library.
+    """
+    # Spawned workers import only what the extraction needs, not torch
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        page_counts = list(pool.map(count_pages, pdf_paths))
+        tasks = ((path, start, min(start + pages_per_task, count))
+                 for path, count in zip(pdf_paths, page_counts)
+                 for start in range(0, count, pages_per_task))
+
+        pending = deque()
+        for path, start, stop in tasks:
+            pending.append((path, pool.submit(extract_page_range, path, start, stop)))
+            if len(pending) >= 2 * workers:
+                path, future = pending.popleft()
+                for page_no, text in future.result():
+                    yield path, page_no, text
+        while pending:
+            path, future = pending.popleft()
+            for page_no, text in future.result():
+                yield path, page_no, text
+
 def extract_text_from_pdfs(pdf_folder):
     """Extract text from all PDFs in a folder."""
     text_chunks = []
-    
+
     for pdf_file in tqdm(os.listdir(pdf_folder), desc="📄 Processing PDFs"):
         if pdf_file.endswith(".pdf"):
-            pdf_path = os.path.join(pdf_folder, pdf_file)
-            pdf_reader = PdfReader(pdf_path)
-
-            for page in pdf_reader.pages:
-                text_chunks.append(page.extract_text())
+            text_chunks.extend(extract_text_from_pdf(os.path.join(pdf_folder, pdf_file)))
 
     print(f"✅ Extracted {len(text_chunks)} text chunks from {len(os.listdir(pdf_folder))} PDFs")
     return text_chunks
 
 # ------------------------------
-# 2️⃣ Generate Embeddings
+# 2️⃣ Split Pages into Token Windows
+# ------------------------------
+def token_spans(text, tokenizer=None):
+    """Character (start, end) of each token: the embedding model's fast tokenizer, else whitespace words."""
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return [span for span in encoding["offset_mapping"] if span[1] > span[0]]
+    return [match.span() for match in re.finditer(r"\S+", text)]
+
+def chunk_text(text, tokenizer=None, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, min_tokens=MIN_CHUNK_TOKENS):
+    """Yield (character offset, chunk text) for sliding windows of ``chunk_tokens`` tokens."""
+    spans = token_spans(text or "", tokenizer)
+    if len(spans) < min_tokens:
+        return
+    step = max(1, chunk_tokens - overlap)
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_tokens]
+        yield window[0][0], text[window[0][0]:window[-1][1]]
+        if start + chunk_tokens >= len(spans):
+            break
+
+def chunk_pages(pages, tokenizer=None, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """Turn streamed (pdf_path, page_no, text) pages into (pdf_path, page_no, offset, text) chunks."""
+    for pdf_path, page_no, text in pages:
+        for offset, chunk in chunk_text(text, tokenizer, chunk_tokens, overlap):
+            yield pdf_path, page_no, offset, chunk
+
+# ------------------------------
+# 3️⃣ Generate Embeddings
 # ------------------------------
-def generate_embeddings(text_chunks, model_name="BAAI/bge-base-en"):
+def load_embed_model(model_name="BAAI/bge-base-en"):
+    # Imported here so the spawned extraction workers do not load torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def generate_embeddings(text_chunks, model_name="BAAI/bge-base-en", embed_model=None):
     """Generate embeddings using a local model."""
-    embed_model = SentenceTransformer(model_name)
+    if embed_model is None:
+        embed_model = load_embed_model(model_name)
     embeddings = embed_model.encode(text_chunks, show_progress_bar=True)
     print(f"✅ Generated {len(embeddings)} embeddings")
     return embeddings
 
+def embed_batches(chunks, embed_model, batch_size=EMBED_BATCH_SIZE):
+    """Group streamed chunks into fixed-size batches and yield (chunks, float32 vectors); text is the last field."""
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch, np.asarray(embed_model.encode([item[-1] for item in batch]), dtype="float32")
+            batch = []
+    if batch:
+        yield batch, np.asarray(embed_model.encode([item[-1] for item in batch]), dtype="float32")
+
 # ------------------------------
-# 3️⃣ Save Data for FAISS
+# 4️⃣ Save Data for FAISS
 # ------------------------------
 def save_data(text_chunks, embeddings, text_file="text_chunks.pkl", emb_file="embeddings.pkl"):
     """Save extracted text and embeddings."""
-    with open(text_file, "wb") as f:
-        pickle.dump(text_chunks, f)
-    with open(emb_file, "wb") as f:
-        pickle.dump(embeddings, f)
+    _dump_pickle(text_chunks, text_file)
+    _dump_pickle(embeddings, emb_file)
     print("✅ Text and embeddings saved!")
 
+def _dump_pickle(obj, path):
+    # Write then rename, so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
 # ------------------------------
-# 4️⃣ Main Execution
+# 5️⃣ Incremental Ingestion
 # ------------------------------
-if __name__ == "__main__":
-    PDF_FOLDER = "pdfs"  # Folder containing all PDFs
+def file_sha256(path):
+    """Content hash of a source file."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    """
+    Load the ingestion manifest.
+
+    Format: {"next_id": int, "settings": {model and chunking}, "files": {pdf_name: {"sha256": str, "ids": [chunk IDs]}}}
+    """
+    if not os.path.exists(manifest_file):
+        return {"next_id": 0, "files": {}}
+    with open(manifest_file, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    tmp_file = f"{manifest_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+def plan_ingestion(pdf_folder, manifest):
+    """Return ({pdf_name: sha256} of new or changed PDFs, [names of deleted PDFs])."""
+    current = {}
+    for pdf_file in sorted(os.listdir(pdf_folder)):
+        if pdf_file.endswith(".pdf"):
+            current[pdf_file] = file_sha256(os.path.join(pdf_folder, pdf_file))
+
+    changed = {name: sha for name, sha in current.items()
+               if manifest["files"].get(name, {}).get("sha256") != sha}
+    removed = [name for name in manifest["files"] if name not in current]
+    return changed, removed
+
+def load_chunks(text_file=TEXT_FILE, manifest=None):
+    """
+    Map the saved chunk file, or return None if there is nothing to build on.
+
+    Without a manifest entry the saved files predate incremental ingestion
+    and are ignored: the first run re-ingests the folder once.
+    """
+    if not manifest or not manifest["files"] or not os.path.exists(text_file):
+        return None
+    try:
+        return ChunkStore(text_file)
+    except ValueError as e:
+        print(f"⚠️ Re-ingesting everything: {e}")
+        return None
+
+def ingest(pdf_folder=PDF_FOLDER, text_file=TEXT_FILE, emb_file=EMB_FILE, index_file=INDEX_FILE,
+           manifest_file=MANIFEST_FILE, model_name="BAAI/bge-base-en", index_type=INDEX_TYPE,
+           workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """
+    Bring the chunks, embeddings and FAISS index in line with the PDF folder.
 
-    # Extract text from all PDFs
-    text_chunks = extract_text_from_pdfs(r"D:\Dental-Clinic-Management\backend\dentalchtabot\sources\resources")
+    Only PDFs whose content hash is new or changed are extracted and
+    embedded; their vectors are added to the ID-mapped index, and vectors
+    of changed or deleted PDFs are removed from it. Pages stream from the
+    extraction workers through the token-window chunker into fixed-size
+    embedding batches, and each batch's vectors go straight to a spool file
+    on disk. Every chunk keeps its source file, page and character offset.
+    """
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_file)
 
-    # Generate embeddings
-    embeddings = generate_embeddings(text_chunks)
+    # Changing the model or the chunking invalidates every chunk
+    settings = {"model": model_name, "chunk_tokens": chunk_tokens, "overlap": overlap}
+    old_chunks = load_chunks(text_file, manifest)
+    if old_chunks is None or not os.path.exists(emb_file) or manifest.get("settings") != settings:
+        old_chunks = {}
+        manifest = {"next_id": manifest.get("next_id", 0), "files": {}}
+    manifest["settings"] = settings
 
-    # Save extracted text and embeddings
-    save_data(text_chunks, embeddings)
+    changed, removed = plan_ingestion(pdf_folder, manifest)
+    if not changed and not removed and os.path.exists(index_file):
+        print("✅ Knowledge base is up to date")
+        return manifest
 
+    # Chunks of changed/deleted files, plus any left by an interrupted run or a reset
+    known_ids = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["ids"]}
+    stale_ids = [chunk_id for name in list(changed) + removed
+                 for chunk_id in manifest["files"].get(name, {}).get("ids", [])]
+    leftover_ids = set(old_chunks) | set(load_vectors(emb_file)[0].tolist())
+    stale_ids = sorted(set(stale_ids) | {chunk_id for chunk_id in leftover_ids if chunk_id not in known_ids})
+    for name in removed:
+        del manifest["files"][name]
+
+    # Copy the surviving chunks into a new chunk file; new ones are appended as they stream in
+    chunk_writer = ChunkWriter(text_file)
+    stale = set(stale_ids)
+    for chunk_id in old_chunks:
+        if chunk_id not in stale:
+            chunk_writer.copy_from(old_chunks, chunk_id)
+
+    # Update the index in place, or rebuild it from the stored vectors at the end when it can't be
+    index = None
+    if known_ids and os.path.exists(index_file):
+        try:
+            index = update_index(faiss.read_index(index_file), remove_ids=stale_ids)
+        except RuntimeError as e:
+            print(f"⚠️ Rebuilding the index from stored vectors: {e}")
+
+    # Stream the new or changed PDFs through extraction and embedding
+    for name, sha in changed.items():
+        manifest["files"][name] = {"sha256": sha, "ids": []}
+    pdf_paths = [os.path.join(pdf_folder, name) for name in changed]
+    spool_file = f"{emb_file}.spool"
+    spool_ids = []
+    if pdf_paths:
+        embed_model = load_embed_model(model_name)
+        pages = stream_pages(pdf_paths, workers=workers)
+        chunks = chunk_pages(pages, getattr(embed_model, "tokenizer", None), chunk_tokens, overlap)
+        with open(spool_file, "wb") as spool:
+            for batch, vectors in tqdm(embed_batches(chunks, embed_model, batch_size), desc="📄 Embedding chunks"):
+                ids = list(range(manifest["next_id"], manifest["next_id"] + len(batch)))
+                manifest["next_id"] += len(batch)
+                for chunk_id, (path, page_no, offset, text) in zip(ids, batch):
+                    chunk_writer.add(chunk_id, text, os.path.basename(path), page_no + 1, offset)
+                    manifest["files"][os.path.basename(path)]["ids"].append(chunk_id)
+                vectors.tofile(spool)
+                spool_ids.extend(ids)
+                if index is not None:
+                    update_index(index, vectors, ids)
+
+    # Merge the spooled vectors into the vector file
+    ids, embeddings = write_vectors(emb_file, remove_ids=stale_ids, spool_file=spool_file, spool_ids=spool_ids)
+    if os.path.exists(spool_file):
+        os.remove(spool_file)
+    if index is None:
+        index = build_index(np.asarray(embeddings, dtype="float32"), index_type=index_type, ids=ids)
+
+    # Manifest last: an interrupted run is redone from the old manifest
+    chunk_writer.commit()
+    save_index(index, index_file)
+    save_manifest(manifest, manifest_file)
+
+    print(f"✅ Ingested {len(changed)} new/changed and removed {len(removed)} PDFs "
+          f"({len(spool_ids)} chunks added, {len(stale_ids)} removed, {index.ntotal} total) "
+          f"in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+# ------------------------------
+# 6️⃣ Main Execution
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the PDF knowledge base for the dental chatbot")
+    parser.add_argument("pdf_folder", nargs="?", default=PDF_FOLDER, help="Folder containing all PDFs")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="PDF extraction processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="Tokens per chunk")
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP, help="Tokens shared by consecutive chunks")
+    args = parser.parse_args()
 
+    # Extract and embed only new or changed PDFs, then update the index
+    ingest(args.pdf_folder, workers=args.workers, batch_size=args.batch_size,
+           chunk_tokens=args.chunk_tokens, overlap=args.overlap)
@@ -1,59 +1,641 @@
-import pickle
-import faiss
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque, namedtuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from langchain_ollama import OllamaLLM
 
+try:
+    from .store import TEXT_FILE, chunk_ids, chunk_metadata, load_search_index, open_text_chunks, text_file_path
+    from .bm25 import BM25Index, looks_like_identifier, reciprocal_rank_fusion
+    from .context import build_context, count_tokens
+except ImportError:  # Run as a script from this folder
+    from store import TEXT_FILE, chunk_ids, chunk_metadata, load_search_index, open_text_chunks, text_file_path
+    from bm25 import BM25Index, looks_like_identifier, reciprocal_rank_fusion
+    from context import build_context, count_tokens
+
+# Files written by embed.py / store.py, next to this script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBED_MODEL_NAME = "BAAI/bge-base-en"
+LLM_MODEL_NAME = os.environ.get("CHAT_LLM_MODEL", "mistral")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL")  # None uses the Ollama default
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # Keep Mistral resident between questions
+
+# Retrieval: "hybrid" fuses BM25 and FAISS results, "dense" uses FAISS only
+RETRIEVAL_MODE = os.environ.get("CHAT_RETRIEVAL", "hybrid")
+HYBRID_CANDIDATES = int(os.environ.get("CHAT_HYBRID_CANDIDATES", "20"))  # Results taken from each retriever
+
+# Extra chunks retrieved beyond k, so dropped near-duplicates can be replaced
+CONTEXT_SPARE_CHUNKS = int(os.environ.get("CHAT_CONTEXT_SPARE_CHUNKS", "3"))
+
+# Chat caches
+EMBED_CACHE_SIZE = int(os.environ.get("CHAT_EMBED_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIZE = int(os.environ.get("CHAT_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get("CHAT_ANSWER_CACHE_MAX_DISTANCE", "0.05"))  # Cosine distance
+
+# Local stand-in LLM (CHAT_LLM_MODEL=fake) for testing streaming without Ollama
+FAKE_TOKENS_PER_SECOND = float(os.environ.get("CHAT_FAKE_TOKENS_PER_SECOND", "20"))
+
 # ------------------------------
 # 1️⃣ Load FAISS Index & Text
 # ------------------------------
-def load_faiss_index(index_file="faiss_index.bin"):
-    """Load FAISS index."""
-    index = faiss.read_index(index_file)
+def load_faiss_index(index_file="faiss_index.bin", emb_file=None):
+    """Load FAISS index, or map the vector file for flat search."""
+    index = load_search_index(index_file, emb_file)
     print(f"✅ Loaded FAISS index with {index.ntotal} embeddings")
     return index
 
-def load_text_chunks(text_file="text_chunks.pkl"):
-    """Load text chunks."""
-    with open(text_file, "rb") as f:
-        text_chunks = pickle.load(f)
+def load_text_chunks(text_file=TEXT_FILE):
+    """Load text chunks (memory-mapped chunk file, or a legacy pickle)."""
+    text_chunks = open_text_chunks(text_file)
     print(f"✅ Loaded {len(text_chunks)} text chunks")
     return text_chunks
 
+def load_embed_model(model_name=EMBED_MODEL_NAME):
+    """Load the sentence embedding model."""
+    return SentenceTransformer(model_name)
+
+class FakeStreamingLLM:
+    """Emits a canned answer word by word at a fixed rate, like a streaming Ollama client."""
+
+    def __init__(self, tokens_per_second=FAKE_TOKENS_PER_SECOND, text=None):
+        self.tokens_per_second = tokens_per_second
+        self.text = text or ("Regular brushing with fluoride toothpaste, daily flossing and routine dental "
+                             "check-ups help prevent caries and gum disease [1].")
+
+    def stream(self, prompt):
+        for word in self.text.split(" "):
+            time.sleep(1 / self.tokens_per_second)
+            yield word + " "
+
+    def invoke(self, prompt):
+        return "".join(self.stream(prompt)).strip()
+
+def load_llm(model_name=LLM_MODEL_NAME):
+    """Create the Ollama LLM client (or the fake one for model name "fake")."""
+    if model_name == "fake":
+        return FakeStreamingLLM()
+    kwargs = {"model": model_name, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if OLLAMA_BASE_URL:
+        kwargs["base_url"] = OLLAMA_BASE_URL
+    return OllamaLLM(**kwargs)
+
 # ------------------------------
 # 2️⃣ Retrieve Relevant Chunks
 # ------------------------------
-def retrieve_top_k(query, index, text_chunks, k=3):
-    """Retrieve top-K similar text chunks."""
-    embed_model = SentenceTransformer("BAAI/bge-base-en")
-    query_embedding = np.array(embed_model.encode([query])).astype("float32")
+def embed_query(query, embed_model):
+    """Encode a query into a float32 row vector."""
+    return np.array(embed_model.encode([query])).astype("float32")
+
+def search_index(query_embedding, index, text_chunks, k=3):
+    """Search FAISS and return the matching text chunks."""
+    return [chunk["text"] for chunk in search_chunks(query_embedding, index, text_chunks, k)]
 
-    # Search FAISS
+def search_chunks(query_embedding, index, text_chunks, k=3):
+    """Search FAISS and return the matching chunks with their source, page and offset."""
     distances, indices = index.search(query_embedding, k)
+    return [chunk_record(text_chunks, chunk_id, distance=float(distance))
+            for distance, chunk_id in zip(distances[0], indices[0]) if chunk_id != -1]
+
+def chunk_record(text_chunks, chunk_id, **scores):
+    """A retrieved chunk: ID, text, source metadata and retrieval scores."""
+    metadata = chunk_metadata(text_chunks, chunk_id) or {"source": None, "page": None, "offset": None}
+    return {"id": int(chunk_id), "text": text_chunks[chunk_id], **scores, **metadata}
+
+def hybrid_search(query, query_embedding, index, bm25_index, text_chunks, k=3, candidates=HYBRID_CANDIDATES):
+    """Fuse FAISS and BM25 results by reciprocal rank fusion and return the top k chunks."""
+    candidates = max(candidates, k)
+    dense = search_chunks(query_embedding, index, text_chunks, candidates)
+    lexical = bm25_index.search(query, candidates)
+    fused = reciprocal_rank_fusion([chunk["id"] for chunk in dense], [chunk_id for chunk_id, _ in lexical])[:k]
+
+    dense_by_id = {chunk["id"]: chunk for chunk in dense}
+    bm25_by_id = dict(lexical)
+    chunks = []
+    for chunk_id, score in fused:
+        chunk = dense_by_id.get(chunk_id) or chunk_record(text_chunks, chunk_id)
+        chunks.append({**chunk, "rrf": round(score, 6), "bm25": bm25_by_id.get(chunk_id)})
+    return chunks
 
-    # Retrieve text
-    retrieved_texts = [text_chunks[i] for i in indices[0]]
+def cite(chunk):
+    """Short citation for a chunk, e.g. 'dentalbookbasics.pdf, p. 12'."""
+    if chunk.get("source") is None:
+        return f"chunk {chunk['id']}"
+    return f"{chunk['source']}, p. {chunk['page']}" if chunk.get("page") else chunk["source"]
+
+def format_context(chunks):
+    """Number the chunks so the answer can cite them as [1], [2], ..."""
+    return "\n\n".join(f"[{number}] ({cite(chunk)})\n{chunk['text']}" for number, chunk in enumerate(chunks, 1))
+
+def retrieve_top_k(query, index, text_chunks, k=3, embed_model=None):
+    """Retrieve top-K similar text chunks."""
+    if embed_model is None:
+        embed_model = load_embed_model()
+    query_embedding = embed_query(query, embed_model)
+
+    # Search FAISS and retrieve text
+    retrieved_texts = search_index(query_embedding, index, text_chunks, k)
     print(f"✅ Retrieved {k} relevant text chunks")
     return retrieved_texts
 
 # ------------------------------
 # 3️⃣ Generate Answer with Mistral
 # ------------------------------
-def generate_answer(query, retrieved_context):
-    """Generate an answer using Mistral."""
+def build_prompt(query, retrieved_context, cite_sources=False):
+    """Build the prompt sent to the LLM."""
     prompt = f"Based on the following documents:\n{retrieved_context}\nAnswer the query: {query}"
-    llm = OllamaLLM(model="mistral")
-    return llm.invoke(prompt)
+    if cite_sources:
+        prompt += "\nCite the documents you used by their number, e.g. [1]."
+    return prompt
+
+def generate_answer(query, retrieved_context, llm=None, cite_sources=False):
+    """Generate an answer using Mistral; a list of retrieved chunks is deduplicated and fit to the prompt budget."""
+    if llm is None:
+        llm = load_llm()
+    if not isinstance(retrieved_context, str):
+        chunks = [chunk if isinstance(chunk, dict) else {"id": i, "text": chunk, "source": None}
+                  for i, chunk in enumerate(retrieved_context)]
+        retrieved_context = format_context(build_context(chunks)[0])
+    return llm.invoke(build_prompt(query, retrieved_context, cite_sources))
+
+# ------------------------------
+# 4️⃣ Query Embedding & Semantic Answer Caches
+# ------------------------------
+def normalize_query(query):
+    """Normalize a query for cache lookups (case, whitespace, trailing punctuation)."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+class EmbeddingCache:
+    """Bounded LRU of query embeddings keyed by the normalized query text."""
+
+    def __init__(self, max_entries=EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class SemanticAnswerCache:
+    """
+    Answers reused for queries whose embeddings are within ``max_distance``
+    cosine distance of a cached query (same k only), evicted LRU.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, max_distance=ANSWER_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # id -> (unit embedding, k, result)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding, k):
+        """Return (result, distance) of the closest cached answer within range, or (None, None)"""
+        query = self._unit(embedding)
+        with self._lock:
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry[1] == k]
+            if candidates:
+                matrix = np.stack([entry[0] for _, entry in candidates])
+                distances = 1.0 - matrix @ query
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[2], float(distances[best])
+            self.misses += 1
+            return None, None
+
+    def add(self, embedding, k, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[self._next_id] = (self._unit(embedding), k, result)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class StreamStats:
+    """Time-to-first-token and tokens/s of recent streamed answers."""
+
+    def __init__(self, window=256):
+        self._ttft_ms = deque(maxlen=window)
+        self._tokens_per_s = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.cancelled = 0
+        self.cache_hits = 0
+
+    def record(self, metrics, cancelled=False, cache_hit=False):
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            else:
+                self.completed += 1
+            if cache_hit:
+                self.cache_hits += 1
+            if metrics["ttft_ms"] is not None:
+                self._ttft_ms.append(metrics["ttft_ms"])
+            if metrics["tokens_per_s"] is not None:
+                self._tokens_per_s.append(metrics["tokens_per_s"])
+
+    def stats(self):
+        with self._lock:
+            ttft = np.array(self._ttft_ms)
+            rates = np.array(self._tokens_per_s)
+            return {
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "cache_hits": self.cache_hits,
+                "ttft_ms_p50": round(float(np.percentile(ttft, 50)), 2) if len(ttft) else None,
+                "ttft_ms_p95": round(float(np.percentile(ttft, 95)), 2) if len(ttft) else None,
+                "tokens_per_s_mean": round(float(rates.mean()), 2) if len(rates) else None,
+            }
+
+# ------------------------------
+# 5️⃣ Long-Lived Chat Service
+# ------------------------------
+# Index, chunk store and BM25 built from the same files; swapped as one object on reload
+IndexState = namedtuple("IndexState", ["index", "text_chunks", "bm25"])
+
+class ChatService:
+    """
+    Keeps the FAISS index, text chunks, embedding model and LLM client resident
+
+    Load once with ``load()``, then call ``answer()`` from any thread; each
+    answer reports how long every stage took. Query embeddings and answers
+    are cached; both caches are dropped when the index files change on disk
+    (i.e. after store.py rebuilds the index), and the new index is loaded.
+    """
+
+    def __init__(self, index_file=os.path.join(SCRIPT_DIR, "faiss_index.bin"),
+                 text_file=os.path.join(SCRIPT_DIR, TEXT_FILE),
+                 emb_file=os.path.join(SCRIPT_DIR, "embeddings.npy"),
+                 embed_model_name=EMBED_MODEL_NAME, llm_model_name=LLM_MODEL_NAME):
+        self.index_file = index_file
+        self.text_file = text_file
+        self.emb_file = emb_file
+        self.embed_model_name = embed_model_name
+        self.llm_model_name = llm_model_name
+        self._state = None  # IndexState; each request reads it once
+        self.embed_model = None
+        self.llm = None
+        self.load_stats = {}
+        self._load_lock = threading.Lock()
+        self._index_fingerprint = None
+        self.embedding_cache = EmbeddingCache()
+        self.answer_cache = SemanticAnswerCache()
+        self.stream_stats = StreamStats()
+        self._prompt_tokens = deque(maxlen=256)
+        self.index_reloads = 0
+
+    @property
+    def ready(self):
+        return self.llm is not None
+
+    @property
+    def index(self):
+        return self._state.index if self._state else None
+
+    @property
+    def text_chunks(self):
+        return self._state.text_chunks if self._state else None
+
+    @property
+    def bm25(self):
+        return self._state.bm25 if self._state else None
+
+    def load(self):
+        """Load every resource once and record how long each took"""
+        with self._load_lock:
+            if self.ready:
+                return self.load_stats
+
+            self._state, timings = self._load_index()
+
+            start = time.perf_counter()
+            self.embed_model = load_embed_model(self.embed_model_name)
+            # Warm the encoder so the first question does not pay for it
+            self.embed_model.encode(["warmup"])
+            timings["embed_model_load_s"] = round(time.perf_counter() - start, 3)
+
+            self.llm = load_llm(self.llm_model_name)
+
+            self.load_stats = {
+                "index_vectors": self.index.ntotal,
+                "text_chunks": len(self.text_chunks),
+                "embed_model": self.embed_model_name,
+                "llm_model": self.llm_model_name,
+                **timings,
+            }
+            print(f"✅ Chat service ready: {self.load_stats}")
+            return self.load_stats
+
+    def _fingerprint(self):
+        fingerprint = []
+        for path in (self.index_file, text_file_path(self.text_file), self.emb_file):
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _load_index(self):
+        """Load the index files into a new IndexState; the caller publishes it, so readers never see a mix"""
+        timings = {}
+        fingerprint = self._fingerprint()
+
+        start = time.perf_counter()
+        index = load_faiss_index(self.index_file, self.emb_file)
+        timings["index_load_s"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        text_chunks = load_text_chunks(self.text_file)
+        timings["chunks_load_s"] = round(time.perf_counter() - start, 3)
+
+        bm25 = None
+        if RETRIEVAL_MODE == "hybrid":
+            bm25 = BM25Index.build(text_chunks, chunk_ids(text_chunks))
+            timings["bm25_build_s"] = bm25.build_time_s
+
+        self._index_fingerprint = fingerprint
+        return IndexState(index, text_chunks, bm25), timings
+
+    def refresh_index(self):
+        """Reload the index and invalidate the caches if the index files were rebuilt"""
+        if self._fingerprint() == self._index_fingerprint:
+            return False
+        with self._load_lock:
+            if self._fingerprint() == self._index_fingerprint:
+                return False
+            self._state, _ = self._load_index()
+            self.embedding_cache.clear()
+            self.answer_cache.clear()
+            self.index_reloads += 1
+            print(f"✅ Index rebuilt on disk, reloaded {self.index.ntotal} vectors and cleared chat caches")
+            return True
+
+    def _embed(self, query):
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = embed_query(query, self.embed_model)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+
+    def _query_embedding(self, query, state):
+        """Embedding of the query, or None when an identifier-like query takes the lexical fast path"""
+        if state.bm25 is not None and looks_like_identifier(query):
+            return None
+        return self._embed(query)
+
+    def _retrieve(self, query, state, query_embedding, k):
+        """Return (chunks, retrieval mode); lexical queries without a BM25 match fall back to dense search"""
+        if query_embedding is None:
+            hits = state.bm25.search(query, k)
+            if hits:
+                return [chunk_record(state.text_chunks, chunk_id, bm25=score) for chunk_id, score in hits], "lexical"
+            query_embedding = self._embed(query)
+        if state.bm25 is None:
+            return search_chunks(query_embedding, state.index, state.text_chunks, k), "dense"
+        return hybrid_search(query, query_embedding, state.index, state.bm25, state.text_chunks, k), "hybrid"
+
+    def _prompt(self, query, chunks, k):
+        """Fit the k best distinct chunks into the token budget; returns (prompt, chunks used, prompt stats)"""
+        tokenizer = getattr(self.embed_model, "tokenizer", None)
+        chunks, stats = build_context(chunks, max_chunks=k, tokenizer=tokenizer)
+        prompt = build_prompt(query, format_context(chunks), cite_sources=True)
+        stats["prompt_tokens"] = count_tokens(prompt, tokenizer)
+        self._prompt_tokens.append(stats["prompt_tokens"])
+        print(f"📝 Prompt: {stats['prompt_tokens']} tokens, {stats['chunks']}/{stats['candidates']} chunks "
+              f"({stats['duplicates_dropped']} duplicate, {stats['over_budget_dropped']} over budget)")
+        return prompt, chunks, stats
+
+    def answer(self, query, k=3):
+        """Answer a question, returning the answer, the retrieved context and per-stage timings in ms"""
+        if not self.ready:
+            self.load()
+        self.refresh_index()
+        # One consistent index, chunk store and BM25 for the whole request, even if a reload happens meanwhile
+        state = self._state
+
+        total_start = time.perf_counter()
+
+        start = time.perf_counter()
+        query_embedding = self._query_embedding(query, state)
+        embed_ms = (time.perf_counter() - start) * 1000
+
+        # A close enough earlier question reuses its answer and skips the LLM
+        cached, distance = (None, None) if query_embedding is None else self.answer_cache.lookup(query_embedding, k)
+        if cached is not None:
+            return {
+                **cached,
+                "cache": {"hit": True, "distance": round(distance, 4)},
+                "timings_ms": {
+                    "embed": round(embed_ms, 2),
+                    "total": round((time.perf_counter() - total_start) * 1000, 2),
+                },
+            }
+
+        start = time.perf_counter()
+        chunks, retrieval = self._retrieve(query, state, query_embedding, k + CONTEXT_SPARE_CHUNKS)
+        search_ms = (time.perf_counter() - start) * 1000
+
+        prompt, chunks, prompt_stats = self._prompt(query, chunks, k)
+        start = time.perf_counter()
+        answer = self.llm.invoke(prompt)
+        generate_ms = (time.perf_counter() - start) * 1000
+
+        result = {"answer": answer, "context": [chunk["text"] for chunk in chunks], "sources": self._sources(chunks)}
+        # An answer from an index replaced meanwhile must not refill the cleared cache
+        if query_embedding is not None and state is self._state:
+            self.answer_cache.add(query_embedding, k, result)
+
+        return {
+            **result,
+            "retrieval": retrieval,
+            "prompt": prompt_stats,
+            "cache": {"hit": False},
+            "timings_ms": {
+                "embed": round(embed_ms, 2),
+                "search": round(search_ms, 2),
+                "generate": round(generate_ms, 2),
+                "total": round((time.perf_counter() - total_start) * 1000, 2),
+            },
+        }
+
+    @staticmethod
+    def _sources(chunks):
+        # Sources in the order they were numbered in the prompt
+        return [{"ref": number, "citation": cite(chunk), "source": chunk["source"],
+                 "page": chunk["page"], "offset": chunk["offset"]}
+                for number, chunk in enumerate(chunks, 1)]
+
+    def stream(self, query, k=3, cancelled=None):
+        """
+        Answer a question, yielding events as the LLM produces tokens
+
+        Events: {"type": "sources"}, then one {"type": "token"} per streamed
+        token, then {"type": "done"} with time-to-first-token and tokens/s.
+        Generation stops when ``cancelled`` (a threading.Event) is set or the
+        generator is closed, and the partial answer is not cached.
+        """
+        if not self.ready:
+            self.load()
+        self.refresh_index()
+        state = self._state
+
+        total_start = time.perf_counter()
+        query_embedding = self._query_embedding(query, state)
+
+        cached, distance = (None, None) if query_embedding is None else self.answer_cache.lookup(query_embedding, k)
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "token", "text": cached["answer"]}
+            ttft_ms = (time.perf_counter() - total_start) * 1000
+            metrics = {"ttft_ms": round(ttft_ms, 2), "tokens": 1, "tokens_per_s": None, "total_ms": round(ttft_ms, 2)}
+            self.stream_stats.record(metrics, cache_hit=True)
+            yield {"type": "done", "cache": {"hit": True, "distance": round(distance, 4)}, "metrics": metrics}
+            return
+
+        chunks, retrieval = self._retrieve(query, state, query_embedding, k + CONTEXT_SPARE_CHUNKS)
+        prompt, chunks, prompt_stats = self._prompt(query, chunks, k)
+        sources = self._sources(chunks)
+        yield {"type": "sources", "retrieval": retrieval, "sources": sources}
+        tokens = []
+        first_token_at = None
+        completed = False
+        llm_stream = self.llm.stream(prompt)
+        try:
+            for token in llm_stream:
+                if cancelled is not None and cancelled.is_set():
+                    break
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                tokens.append(token)
+                yield {"type": "token", "text": token}
+            else:
+                completed = True
+        finally:
+            # Closing the LLM stream drops the connection to Ollama, which stops generating
+            close = getattr(llm_stream, "close", None)
+            if close is not None:
+                close()
+            end = time.perf_counter()
+            metrics = {
+                "ttft_ms": round((first_token_at - total_start) * 1000, 2) if first_token_at else None,
+                "tokens": len(tokens),
+                "tokens_per_s": round((len(tokens) - 1) / (end - first_token_at), 2)
+                                if first_token_at and len(tokens) > 1 and end > first_token_at else None,
+                "total_ms": round((end - total_start) * 1000, 2),
+            }
+            self.stream_stats.record(metrics, cancelled=not completed)
+        if not completed:
+            return
+
+        answer = "".join(tokens).strip()
+        result = {"answer": answer, "context": [chunk["text"] for chunk in chunks], "sources": sources}
+        # An answer from an index replaced meanwhile must not refill the cleared cache
+        if query_embedding is not None and state is self._state:
+            self.answer_cache.add(query_embedding, k, result)
+        yield {"type": "done", "cache": {"hit": False}, "prompt": prompt_stats, "metrics": metrics}
+
+    def _prompt_stats(self):
+        tokens = np.array(self._prompt_tokens)
+        if not len(tokens):
+            return {"count": 0}
+        return {
+            "count": len(tokens),
+            "tokens_p50": int(np.percentile(tokens, 50)),
+            "tokens_p95": int(np.percentile(tokens, 95)),
+            "tokens_max": int(tokens.max()),
+        }
+
+    def cache_stats(self):
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "answers": self.answer_cache.stats(),
+            "streams": self.stream_stats.stats(),
+            "bm25": self.bm25.stats() if self.bm25 is not None else None,
+            "prompts": self._prompt_stats(),
+            "index_reloads": self.index_reloads,
+        }
 
 # ------------------------------
-# 4️⃣ Main Execution
+# 6️⃣ Main Execution
 # ------------------------------
 if __name__ == "__main__":
-    index = load_faiss_index()
-    text_chunks = load_text_chunks()
+    service = ChatService()
+    service.load()
 
-    query = input("\n❓ Enter your question: ")
-    retrieved_context = retrieve_top_k(query, index, text_chunks, k=3)
-    answer = generate_answer(query, retrieved_context)
+    # Keep answering until an empty question, reusing the loaded models
+    while True:
+        query = input("\n❓ Enter your question: ").strip()
+        if not query:
+            break
+        result = service.answer(query, k=3)
 
-    print("\n🤖 Mistral's Answer:\n", answer)
+        print("\n🤖 Mistral's Answer:\n", result["answer"])
+        for source in result["sources"]:
+            print(f"📚 [{source['ref']}] {source['citation']}")
+        print(f"⏱️ {result['timings_ms']}")
@@ -1,35 +1,457 @@
+import os
+import json
+import math
+import mmap
 import pickle
+import struct
+import argparse
+from array import array
 import faiss
 import numpy as np
 
+# Index settings, overridable per deployment (see benchmark_index.py to pick them)
+INDEX_TYPES = ("flat", "hnsw", "ivf-flat", "ivf-pq")
+INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "flat")
+HNSW_M = int(os.environ.get("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("FAISS_HNSW_EF_CONSTRUCTION", "40"))
+HNSW_EF_SEARCH = int(os.environ.get("FAISS_HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.environ.get("FAISS_IVF_NLIST", "0"))  # 0 picks one from the number of vectors
+IVF_NPROBE = int(os.environ.get("FAISS_IVF_NPROBE", "8"))
+PQ_M = int(os.environ.get("FAISS_PQ_M", "16"))  # Sub-quantizers, i.e. bytes per vector at 8 bits
+PQ_NBITS = int(os.environ.get("FAISS_PQ_NBITS", "8"))
+
+# On-disk formats: vectors are stored as float16 unless VECTOR_DTYPE says otherwise
+VECTOR_DTYPE = os.environ.get("VECTOR_DTYPE", "float16")
+TEXT_FILE = "chunks.bin"
+LEGACY_TEXT_FILE = "text_chunks.pkl"
+
 # ------------------------------
 # 1️⃣ Load Saved Data
 # ------------------------------
-def load_data(text_file="text_chunks.pkl", emb_file="embeddings.pkl"):
-    """Load saved text chunks and embeddings."""
-    with open(text_file, "rb") as f:
-        text_chunks = pickle.load(f)
-    with open(emb_file, "rb") as f:
-        embeddings = pickle.load(f)
+def load_data(text_file=TEXT_FILE, emb_file="embeddings.npy"):
+    """
+    Load saved text chunks and embeddings.
+
+    Chunks come from the chunk file written by embed.py (a ChunkStore keyed
+    by chunk ID) or a legacy text_chunks.pkl list. Embeddings come from the
+    vector file, or from a legacy embeddings.pkl list. Embedding rows are
+    returned as float32 in the order of ``chunk_ids(text_chunks)``.
+    """
+    text_chunks = open_text_chunks(text_file)
+
+    legacy_file = os.path.splitext(emb_file)[0] + ".pkl"
+    if emb_file.endswith(".npy") and (os.path.exists(emb_file) or not os.path.exists(legacy_file)):
+        ids, embeddings = load_vectors(emb_file)
+        wanted = chunk_ids(text_chunks)
+        if not np.array_equal(ids, wanted):
+            sorter = np.argsort(ids)
+            embeddings = embeddings[sorter[np.searchsorted(ids, wanted, sorter=sorter)]]
+        embeddings = np.asarray(embeddings, dtype="float32")
+    else:
+        with open(legacy_file if emb_file.endswith(".npy") else emb_file, "rb") as f:
+            embeddings = pickle.load(f)
+        embeddings = np.array(embeddings).astype("float32")
 
     print(f"✅ Loaded {len(text_chunks)} text chunks and {len(embeddings)} embeddings")
-    return text_chunks, np.array(embeddings).astype("float32")
+    return text_chunks, embeddings
+
+def chunk_ids(text_chunks):
+    """FAISS IDs of the chunks: chunk store or dict keys, or row numbers for a plain list."""
+    if isinstance(text_chunks, ChunkStore):
+        return np.array(text_chunks.ids)
+    if isinstance(text_chunks, dict):
+        return np.array(list(text_chunks), dtype="int64")
+    return np.arange(len(text_chunks), dtype="int64")
+
+# ------------------------------
+# 2️⃣ Vector File
+# ------------------------------
+# embed.py saves VECTOR_DTYPE rows in embeddings.npy and their chunk IDs in embeddings_ids.npy
+def ids_file_for(emb_file):
+    return os.path.splitext(emb_file)[0] + "_ids.npy"
+
+def load_vectors(emb_file):
+    """Memory-map the saved vectors; returns (ids, embeddings)."""
+    if not os.path.exists(emb_file):
+        return np.zeros(0, dtype="int64"), np.zeros((0, 0), dtype="float32")
+    return np.load(ids_file_for(emb_file), mmap_mode="r"), np.load(emb_file, mmap_mode="r")
+
+def write_vectors(emb_file, remove_ids=(), spool_file=None, spool_ids=(), block_rows=4096):
+    """
+    Rewrite the vector file without ``remove_ids`` and with the raw float32
+    rows of ``spool_file`` appended, copying block by block so memory stays
+    flat. Rows are stored as VECTOR_DTYPE. Returns the new (ids, embeddings),
+    memory-mapped.
+    """
+    old_ids, old = load_vectors(emb_file)
+    keep = np.flatnonzero(~np.isin(old_ids, np.asarray(remove_ids, dtype="int64")))
+    spool_ids = np.asarray(spool_ids, dtype="int64")
+
+    dim = old.shape[1]
+    if len(spool_ids):
+        dim = os.path.getsize(spool_file) // (4 * len(spool_ids))
+    spool = np.memmap(spool_file, dtype="float32", mode="r", shape=(len(spool_ids), dim)) if len(spool_ids) else None
+
+    tmp_file = f"{emb_file}.tmp.npy"
+    out = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=VECTOR_DTYPE, shape=(len(keep) + len(spool_ids), dim))
+    for start in range(0, len(keep), block_rows):
+        rows = keep[start:start + block_rows]
+        out[start:start + len(rows)] = old[rows]
+    for start in range(0, len(spool_ids), block_rows):
+        out[len(keep) + start:len(keep) + start + block_rows] = spool[start:start + block_rows]
+    out.flush()
+    del out, spool, old
+
+    ids = np.concatenate([old_ids[keep], spool_ids])
+    np.save(f"{ids_file_for(emb_file)}.tmp.npy", ids)
+    os.replace(tmp_file, emb_file)
+    os.replace(f"{ids_file_for(emb_file)}.tmp.npy", ids_file_for(emb_file))
+    return load_vectors(emb_file)
+
+class MappedFlatIndex:
+    """
+    Exact L2 search straight over the memory-mapped vector file
+
+    Same results as IndexFlatL2 (up to float16 rounding) but nothing is
+    loaded: every worker process searches the same page-cache pages.
+    ``search`` returns chunk IDs, like an ID-mapped FAISS index.
+    """
+
+    def __init__(self, emb_file, block_rows=65536):
+        self.ids, self.vectors = load_vectors(emb_file)
+        if len(self.ids) != len(self.vectors):
+            raise RuntimeError(f"{emb_file} and its IDs file disagree, the vector file is being rewritten")
+        self.ntotal = len(self.ids)
+        self.block_rows = block_rows
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype="float32")
+        best_distances = np.full((len(queries), k), np.inf, dtype="float32")
+        best_rows = np.full((len(queries), k), -1, dtype="int64")
+        query_norms = (queries * queries).sum(axis=1)[:, None]
+
+        for start in range(0, self.ntotal, self.block_rows):
+            block = np.asarray(self.vectors[start:start + self.block_rows], dtype="float32")
+            distances = query_norms - 2 * queries @ block.T + (block * block).sum(axis=1)[None, :]
+            rows = np.broadcast_to(np.arange(start, start + len(block)), distances.shape)
+
+            distances = np.concatenate([best_distances, distances], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            top = np.argsort(distances, axis=1)[:, :k]
+            best_distances = np.take_along_axis(distances, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        if self.ntotal == 0:
+            return best_distances, best_rows
+        return best_distances, np.where(best_rows >= 0, self.ids[np.maximum(best_rows, 0)], -1)
+
+def load_search_index(index_file, emb_file=None, index_type=INDEX_TYPE):
+    """Flat search maps the vector file when there is one; other index types load the FAISS index."""
+    if index_type == "flat" and emb_file and os.path.exists(emb_file):
+        return MappedFlatIndex(emb_file)
+    return faiss.read_index(index_file)
 
 # ------------------------------
-# 2️⃣ Store in FAISS
+# 3️⃣ Chunk File
 # ------------------------------
-def store_in_faiss(embeddings, index_file="faiss_index.bin"):
+# One file so it can be replaced atomically:
+#   header (magic, count, blob size, sources size) | UTF-8 blob, padded to 8 bytes
+#   | ids int64[count] | offsets int64[count + 1]
+#   | source index, page, character offset int64[count] each | JSON list of source names
+CHUNK_MAGIC = b"CHUNKS02"
+CHUNK_HEADER = struct.Struct("<8sQQQ")
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk text keyed by chunk ID
+
+    Behaves like a {chunk ID: text} dict; text is decoded only when looked
+    up. ``metadata(chunk_id)`` gives the chunk's source file, page and
+    character offset within the page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, blob_size, sources_size = CHUNK_HEADER.unpack_from(self._map, 0)
+        if magic != CHUNK_MAGIC:
+            raise ValueError(f"{path} is not a chunk file, or an older format: re-run embed.py")
+
+        def column(position, length):
+            offset = CHUNK_HEADER.size + _padded(blob_size) + 8 * position
+            return np.frombuffer(self._map, dtype="int64", count=length, offset=offset)
+
+        self.ids = column(0, count)
+        self.offsets = column(count, count + 1)
+        self.source_index = column(2 * count + 1, count)
+        self.pages = column(3 * count + 1, count)
+        self.char_offsets = column(4 * count + 1, count)
+        sources_start = CHUNK_HEADER.size + _padded(blob_size) + 8 * (5 * count + 1)
+        self.sources = json.loads(self._map[sources_start:sources_start + sources_size].decode("utf-8"))
+
+    def _row(self, chunk_id):
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row >= len(self.ids) or self.ids[row] != chunk_id:
+            raise KeyError(chunk_id)
+        return row
+
+    def __getitem__(self, chunk_id):
+        row = self._row(chunk_id)
+        start = CHUNK_HEADER.size + int(self.offsets[row])
+        stop = CHUNK_HEADER.size + int(self.offsets[row + 1])
+        return self._map[start:stop].decode("utf-8")
+
+    def metadata(self, chunk_id):
+        """{"source", "page", "offset"} of a chunk; unknown fields are None."""
+        row = self._row(chunk_id)
+        source_index, page, offset = (int(self.source_index[row]), int(self.pages[row]), int(self.char_offsets[row]))
+        return {
+            "source": self.sources[source_index] if source_index >= 0 else None,
+            "page": page if page >= 0 else None,
+            "offset": offset if offset >= 0 else None,
+        }
+
+    def __contains__(self, chunk_id):
+        try:
+            self._row(chunk_id)
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (int(chunk_id) for chunk_id in self.ids)
+
+    def items(self):
+        for chunk_id in self:
+            yield chunk_id, self[chunk_id]
+
+class ChunkWriter:
+    """
+    Stream chunks into a new chunk file
+
+    IDs must be added in increasing order. ``commit()`` replaces ``path``
+    atomically; readers that already mapped the old file keep their view.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, 0, 0, 0))
+        self._ids = array("q")
+        self._offsets = array("q", [0])
+        self._source_index = array("q")
+        self._pages = array("q")
+        self._char_offsets = array("q")
+        self._sources = {}
+
+    def add(self, chunk_id, text, source=None, page=None, offset=None):
+        """Append a chunk; ``page`` is 1-based, ``offset`` the character offset within the page."""
+        if self._ids and chunk_id <= self._ids[-1]:
+            raise ValueError(f"Chunk IDs must increase, got {chunk_id} after {self._ids[-1]}")
+        data = (text or "").encode("utf-8")
+        self._file.write(data)
+        self._ids.append(chunk_id)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._source_index.append(self._sources.setdefault(source, len(self._sources)) if source is not None else -1)
+        self._pages.append(page if page is not None else -1)
+        self._char_offsets.append(offset if offset is not None else -1)
+
+    def copy_from(self, store, chunk_id):
+        """Append a chunk of an existing ChunkStore with its metadata."""
+        metadata = store.metadata(chunk_id)
+        self.add(chunk_id, store[chunk_id], metadata["source"], metadata["page"], metadata["offset"])
+
+    def commit(self):
+        blob_size = self._offsets[-1]
+        sources = json.dumps(list(self._sources)).encode("utf-8")
+        self._file.write(b"\0" * (_padded(blob_size) - blob_size))
+        for column in (self._ids, self._offsets, self._source_index, self._pages, self._char_offsets):
+            self._file.write(column.tobytes())
+        self._file.write(sources)
+        self._file.seek(0)
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(self._ids), blob_size, len(sources)))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+def chunk_metadata(text_chunks, chunk_id):
+    """Source metadata of a chunk, or None for legacy pickled chunks."""
+    if isinstance(text_chunks, ChunkStore):
+        return text_chunks.metadata(chunk_id)
+    return None
+
+def text_file_path(text_file):
+    """The chunk file, or the legacy text_chunks.pkl next to it if there is no chunk file yet."""
+    legacy_file = os.path.join(os.path.dirname(text_file), LEGACY_TEXT_FILE)
+    if not os.path.exists(text_file) and os.path.exists(legacy_file):
+        return legacy_file
+    return text_file
+
+def open_text_chunks(text_file=TEXT_FILE):
+    """Map a chunk file, or unpickle a legacy list/dict of chunks."""
+    text_file = text_file_path(text_file)
+    if text_file.endswith(".pkl"):
+        with open(text_file, "rb") as f:
+            return pickle.load(f)
+    return ChunkStore(text_file)
+
+# ------------------------------
+# 4️⃣ Build the Index
+# ------------------------------
+def default_nlist(num_vectors):
+    """About 4 * sqrt(n) lists, keeping at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def build_index(embeddings, index_type=INDEX_TYPE, ids=None, hnsw_m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                ef_search=HNSW_EF_SEARCH, nlist=IVF_NLIST, nprobe=IVF_NPROBE, pq_m=PQ_M, pq_nbits=PQ_NBITS):
+    """
+    Build an L2 index over the embeddings.
+
+    With ``ids`` the index is ID-mapped: searches return those IDs and
+    vectors can later be added or removed by ID (see update_index).
+
+    index_type:
+        flat      exact exhaustive scan (IndexFlatL2)
+        hnsw      graph index; hnsw_m links per node, ef_search trades speed for recall
+        ivf-flat  inverted lists of full vectors; nlist lists, nprobe lists scanned per query
+        ivf-pq    inverted lists of product-quantized codes (pq_m codes of pq_nbits bits)
+    """
+    num_vectors, dim = embeddings.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in ("ivf-flat", "ivf-pq"):
+        nlist = nlist or default_nlist(num_vectors)
+        if num_vectors < nlist:
+            raise ValueError(f"{index_type} needs at least nlist={nlist} vectors to train, got {num_vectors}")
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf-flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m != 0:
+                raise ValueError(f"PQ code size pq_m={pq_m} must divide the embedding dimension {dim}")
+            if num_vectors < 2 ** pq_nbits:
+                raise ValueError(f"ivf-pq with {pq_nbits} bits needs at least {2 ** pq_nbits} vectors to train, got {num_vectors}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {list(INDEX_TYPES)}")
+
+    if ids is None:
+        index.add(embeddings)
+    else:
+        # IVF indexes store IDs natively; the others need an ID map around them
+        if not index_type.startswith("ivf"):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+    set_search_params(index, ef_search=ef_search, nprobe=nprobe)
+    return index
+
+def update_index(index, add_embeddings=None, add_ids=None, remove_ids=None):
+    """
+    Remove and add vectors of an ID-mapped index in place.
+
+    Raises RuntimeError if the index cannot do it (not ID-mapped, or HNSW,
+    which does not support removal); callers then rebuild with build_index.
+    """
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF)):
+        raise RuntimeError("Index is not ID-mapped")
+    if remove_ids is not None and len(remove_ids):
+        index.remove_ids(np.asarray(remove_ids, dtype="int64"))
+    if add_ids is not None and len(add_ids):
+        index.add_with_ids(np.asarray(add_embeddings, dtype="float32"), np.asarray(add_ids, dtype="int64"))
+    return index
+
+def set_search_params(index, ef_search=None, nprobe=None):
+    """Apply search-time parameters; they are saved with the index."""
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    if nprobe is not None:
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return  # Not an IVF index
+        ivf.nprobe = min(nprobe, ivf.nlist)
+
+def save_index(index, index_file):
+    """Write the index atomically, so a running chat service never reads half a file."""
+    tmp_file = f"{index_file}.tmp"
+    faiss.write_index(index, tmp_file)
+    os.replace(tmp_file, index_file)
+
+def index_memory_bytes(index):
+    """Size of the serialized index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
+
+# ------------------------------
+# 5️⃣ Store in FAISS
+# ------------------------------
+def convert_legacy(text_file=TEXT_FILE, emb_file="embeddings.npy"):
+    """Write the chunk and vector files from legacy text_chunks.pkl / embeddings.pkl, without re-embedding."""
+    text_chunks, embeddings = load_data(text_file, emb_file)
+    ids = chunk_ids(text_chunks)
+
+    writer = ChunkWriter(text_file)
+    for chunk_id in ids:
+        writer.add(int(chunk_id), text_chunks[int(chunk_id)])
+    writer.commit()
+
+    spool_file = f"{emb_file}.spool"
+    np.ascontiguousarray(embeddings, dtype="float32").tofile(spool_file)
+    write_vectors(emb_file, spool_file=spool_file, spool_ids=ids)
+    os.remove(spool_file)
+    print(f"✅ Converted {len(ids)} chunks to {text_file} and {emb_file}")
+
+def store_in_faiss(embeddings, index_file="faiss_index.bin", index_type=INDEX_TYPE, ids=None, **params):
     """Store embeddings in FAISS."""
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+    index = build_index(embeddings, index_type=index_type, ids=ids, **params)
 
     # Save index
-    faiss.write_index(index, index_file)
-    print(f"✅ Stored {index.ntotal} embeddings in FAISS")
+    save_index(index, index_file)
+    print(f"✅ Stored {index.ntotal} embeddings in FAISS ({index_type}, {index_memory_bytes(index) / 1e6:.1f} MB)")
+    return index
 
 # ------------------------------
-# 3️⃣ Main Execution
+# 6️⃣ Main Execution
 # ------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FAISS index for the dental chatbot")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--hnsw-m", type=int, default=HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", type=int, default=HNSW_EF_SEARCH)
+    parser.add_argument("--nlist", type=int, default=IVF_NLIST)
+    parser.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    parser.add_argument("--pq-m", type=int, default=PQ_M)
+    parser.add_argument("--pq-nbits", type=int, default=PQ_NBITS)
+    parser.add_argument("--convert-legacy", action="store_true",
+                        help="First convert text_chunks.pkl/embeddings.pkl to the memory-mapped files")
+    args = parser.parse_args()
+
+    if args.convert_legacy:
+        convert_legacy()
     text_chunks, embeddings = load_data()
-    store_in_faiss(embeddings)
+    store_in_faiss(
+        embeddings,
+        index_type=args.index_type,
+        ids=chunk_ids(text_chunks),
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        ef_search=args.ef_search,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+    )
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
@@ -6,14 +6,20 @@ import os
 import shutil
 import tempfile
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import json
 import pickle
 from datetime import datetime
 import re
+import time
+import asyncio
 import logging
-from fastapi.responses import FileResponse
+import threading
+import zipfile
+from contextlib import asynccontextmanager, suppress
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
 
 
@@ -22,13 +28,115 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 # Import model modules
-from models.xray_analyzer import analyze_xray_image
-from models.photo_analyzer import analyze_dental_photo
+from models.xray_analyzer import analyze_xray_image, analyze_xray_images
+from models.photo_analyzer import analyze_dental_photo, analyze_dental_photos
 from models.prescription_extractor import extract_medical_data
 from models.treatment_recommender import generate_treatment_plan
+from models.executor import ExecutorBusyError, executor_from_env
+from models import xray_analyzer, photo_analyzer
+from models.artifact_store import artifact_store
+from models.extraction_cache import extraction_cache, audit_sink
+from models.patient_store import patient_store
+
+# Number of warmup inferences each model runs at startup
+WARMUP_RUNS = int(os.environ.get("MODEL_WARMUP_RUNS", "2"))
+
+# Most PDFs (uploaded or inside zip archives) accepted by one /api/extract/batch request
+EXTRACT_BATCH_MAX_FILES = int(os.environ.get("EXTRACT_BATCH_MAX_FILES", "5000"))
+# Zip archives past these limits are rejected with a 413 before anything is extracted
+EXTRACT_ZIP_MAX_MEMBERS = int(os.environ.get("EXTRACT_ZIP_MAX_MEMBERS", "10000"))
+EXTRACT_ZIP_MAX_MEMBER_BYTES = int(os.environ.get("EXTRACT_ZIP_MAX_MEMBER_BYTES", str(50 * 1024 * 1024)))
+EXTRACT_ZIP_MAX_BYTES = int(os.environ.get("EXTRACT_ZIP_MAX_BYTES", str(1024 * 1024 * 1024)))  # Uncompressed, per archive
+
+# Inference executors, one per model. Each can be switched between a thread and a
+# process pool and sized through environment variables (see models/executor.py).
+# Process workers preload their own copy of the model when they start.
+executors = {
+    "xray": executor_from_env("xray", max_workers=8, max_pending=32,
+                              initializer=xray_analyzer.preload, initargs=(WARMUP_RUNS,)),
+    "photo": executor_from_env("photo", max_workers=16, max_pending=64,
+                               initializer=photo_analyzer.preload, initargs=(WARMUP_RUNS,)),
+    "extract": executor_from_env("extract", max_workers=2, max_pending=16),
+    # Bulk imports parse many PDFs at once; processes keep pypdf off the server's GIL
+    "extract_batch": executor_from_env("extract_batch", kind="process",
+                                       max_workers=os.cpu_count() or 2, max_pending=4 * (os.cpu_count() or 2)),
+    "treatment": executor_from_env("treatment", max_workers=4, max_pending=64),
+    "chat": executor_from_env("chat", max_workers=4, max_pending=32),
+}
+
+# Readiness of each preloaded model, reported by /ready
+preloaded_models = {
+    "xray": xray_analyzer,
+    "photo": photo_analyzer,
+}
+model_status = {name: {"ready": False, "state": "pending"} for name in preloaded_models}
+
+async def preload_model(name):
+    """Load one model and run its warmup passes, recording the outcome"""
+    executor = executors[name]
+    module = preloaded_models[name]
+    preload = module.preload
+    model_status[name] = {"ready": False, "state": "loading"}
+    start = time.perf_counter()
+    try:
+        if executor.kind == "process":
+            # Start every worker process; each preloads through the pool initializer
+            worker_stats = await asyncio.gather(*[executor.run(preload, WARMUP_RUNS) for _ in range(executor.max_workers)])
+            stats = dict(worker_stats[0], workers=executor.max_workers)
+        else:
+            stats = await run_in_threadpool(preload, WARMUP_RUNS)
+        model_status[name] = {"ready": True, "state": "ready", "startup_time_s": round(time.perf_counter() - start, 3), **stats}
+        logger.info(f"Model '{name}' ready: {model_status[name]}")
+    except Exception as e:
+        logger.error(f"Failed to preload model '{name}': {str(e)}")
+        model_status[name] = {
+            "ready": False,
+            "state": "failed",
+            "error": str(e),
+            "weights_path": module.MODEL_PATH,
+            "weights_exist": os.path.exists(module.MODEL_PATH)
+        }
+
+# RAG chatbot, loaded once at startup; it does not gate /ready
+chat_service = None
+chat_status = {"ready": False, "state": "pending"}
+
+async def load_chat_service():
+    """Load the FAISS index, text chunks, embedding model and LLM client once"""
+    global chat_service, chat_status
+    chat_status = {"ready": False, "state": "loading"}
+    try:
+        # Imported lazily so the image endpoints work without the chatbot dependencies
+        from dentalchtabot.scripts.query import ChatService
+
+        service = ChatService()
+        stats = await run_in_threadpool(service.load)
+        chat_service = service
+        chat_status = {"ready": True, "state": "ready", **stats}
+        logger.info(f"Chat service ready: {stats}")
+    except Exception as e:
+        logger.error(f"Failed to load chat service: {str(e)}")
+        chat_status = {"ready": False, "state": "failed", "error": str(e)}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the patient database first; on the first run this imports data/patients.json
+    patients = await run_in_threadpool(patient_store.count)
+    logger.info(f"Patient store ready with {patients} patients")
+    # Preload in the background so the server can answer /ready while models load
+    preload_task = asyncio.ensure_future(asyncio.gather(
+        *[preload_model(name) for name in preloaded_models],
+        load_chat_service()
+    ))
+    yield
+    preload_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await preload_task
+    for executor in executors.values():
+        executor.shutdown()
 
 # Create FastAPI app
-app = FastAPI(title="Dental Clinic AI Backend")
+app = FastAPI(title="Dental Clinic AI Backend", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -42,6 +150,20 @@ app.add_middleware(
 # Create temp directory for file uploads if it doesn't exist
 os.makedirs("static/temp", exist_ok=True)
 
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request, exc: ExecutorBusyError):
+    logger.warning(f"Rejecting request: {str(exc)}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"The {exc.name} model is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def save_upload(file: UploadFile, path: str):
+    """Copy an uploaded file to disk (blocking, run in a worker thread)"""
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
 # Define data models
 class PatientData(BaseModel):
     name: str
@@ -54,6 +176,10 @@ class PatientData(BaseModel):
     xrayFindings: Optional[str] = None
     photoFindings: Optional[str] = None
 
+class ChatRequest(BaseModel):
+    question: str
+    k: int = Field(3, ge=1, le=20)  # Chunks in the prompt; retrieval fetches more, so it must stay positive
+
 class TreatmentPlan(BaseModel):
     diagnosis: str
     symptoms: Optional[str] = None
@@ -80,46 +206,12 @@ class PatientRecord(BaseModel):
     treatmentPlan: Optional[Dict[str, Any]] = None
 print("checkpoint1")
 # API Endpoints
-os.makedirs("temp", exist_ok=True)
 @app.get("/")
 async def root():
     print("Root endpoint called")  # Debug log
     return {"message": "Dental Clinic AI Backend API"}
 
 # 1. Prescription Extraction Endpoint
-@app.post("/api/extract")
-async def extract_prescription(file: UploadFile = File(...)):
-    print("Extract prescription endpoint called")  # Debug log
-    if not file.filename.endswith('.pdf'):
-        print("Invalid file type for prescription extraction")  # Debug log
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    # Save uploaded file temporarily
-    temp_file_path = f"staic/temp/{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    try:
-        # Extract data from PDF
-        logger.info(f"Extracting data from PDF: {file.filename}")
-        print(f"Extracting data from PDF: {file.filename}")  # Debug log
-        patient_data = extract_medical_data(temp_file_path)
-        if not patient_data:
-            logger.error("Failed to extract data from PDF")
-            print("Failed to extract data from PDF")  # Debug log
-            raise HTTPException(status_code=500, detail="Failed to extract data from PDF")
-        
-        logger.info(f"Successfully extracted data: {patient_data}")
-        print(f"Successfully extracted data: {patient_data}")  # Debug log
-        return patient_data
-    except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
-        print(f"Error processing PDF: {str(e)}")  # Debug log
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
-    finally:
-        # Clean up temp file
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
 print("checkpoint2")
 @app.post("/api/extract")
 async def extract_prescription(file: UploadFile = File(...)):
@@ -130,14 +222,13 @@ async def extract_prescription(file: UploadFile = File(...)):
 
     # ✅ Correct indentation
     temp_file_path = f"static/temp/{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_threadpool(save_upload, file, temp_file_path)
 
     try:
         # Extract data from PDF
         logger.info(f"Extracting data from PDF: {file.filename}")
         print(f"Extracting data from PDF: {file.filename}")  # Debug log
-        patient_data = extract_medical_data(temp_file_path)
+        patient_data = await executors["extract"].run(extract_medical_data, temp_file_path)
         if not patient_data:
             logger.error("Failed to extract data from PDF")
             print("Failed to extract data from PDF")  # Debug log
@@ -146,6 +237,8 @@ async def extract_prescription(file: UploadFile = File(...)):
         logger.info(f"Successfully extracted data: {patient_data}")
         print(f"Successfully extracted data: {patient_data}")  # Debug log
         return patient_data
+    except ExecutorBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         print(f"Error processing PDF: {str(e)}")  # Debug log
@@ -155,34 +248,194 @@ async def extract_prescription(file: UploadFile = File(...)):
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
 
+def check_zip_limits(filename: str, archive: zipfile.ZipFile):
+    """
+    Reject a zip archive whose member count or uncompressed sizes exceed the configured limits
+
+    Uses the sizes declared in the archive's directory; zipfile never reads
+    more than a member's declared size, so they also bound what is written.
+    """
+    members = archive.infolist()
+    if len(members) > EXTRACT_ZIP_MAX_MEMBERS:
+        raise HTTPException(status_code=413,
+                            detail=f"{filename} has {len(members)} entries, the limit is {EXTRACT_ZIP_MAX_MEMBERS}")
+    for member in members:
+        if member.file_size > EXTRACT_ZIP_MAX_MEMBER_BYTES:
+            raise HTTPException(status_code=413,
+                                detail=f"{filename}/{member.filename} is {member.file_size} bytes uncompressed, "
+                                       f"the limit is {EXTRACT_ZIP_MAX_MEMBER_BYTES}")
+    total = sum(member.file_size for member in members)
+    if total > EXTRACT_ZIP_MAX_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"{filename} is {total} bytes uncompressed, the limit is {EXTRACT_ZIP_MAX_BYTES}")
+
+def stage_extract_uploads(uploads: List[UploadFile], batch_dir: str):
+    """
+    Write uploaded PDFs, and the PDFs inside uploaded zip archives, to batch_dir (blocking)
+
+    Returns one (filename, path, error) per document; path is None and error
+    says why when a file cannot be extracted, so it is reported inline.
+    """
+    documents = []
+    for upload in uploads:
+        filename = upload.filename or "upload"
+        if filename.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(upload.file) as archive:
+                    check_zip_limits(filename, archive)
+                    for member in archive.infolist():
+                        if member.is_dir() or not member.filename.lower().endswith(".pdf"):
+                            continue
+                        if len(documents) >= EXTRACT_BATCH_MAX_FILES:
+                            break
+                        # Members are written under a generated name, never their archive path
+                        path = os.path.join(batch_dir, f"{len(documents)}.pdf")
+                        with archive.open(member) as source, open(path, "wb") as target:
+                            shutil.copyfileobj(source, target)
+                        documents.append((f"{filename}/{member.filename}", path, None))
+            except zipfile.BadZipFile as e:
+                documents.append((filename, None, f"Invalid zip archive: {str(e)}"))
+        elif filename.lower().endswith(".pdf"):
+            path = os.path.join(batch_dir, f"{len(documents)}.pdf")
+            save_upload(upload, path)
+            documents.append((filename, path, None))
+        else:
+            documents.append((filename, None, "Only PDF files and zip archives are supported"))
+        if len(documents) >= EXTRACT_BATCH_MAX_FILES:
+            break
+    return documents
+
+# Bulk prescription extraction, one NDJSON line per document
+@app.post("/api/extract/batch")
+async def extract_prescription_batch(files: List[UploadFile] = File(...)):
+    """
+    Extract many PDFs (or zip archives of PDFs) in one request
+
+    Documents are parsed on the extract_batch process pool and one JSON line
+    is streamed per document as soon as it finishes, in completion order:
+    {"index", "filename", "status": "ok", "data", "elapsed_ms"}, or
+    "status": "error" with an "error" message; a failing document does not
+    stop the others. The last line is {"summary": {...}}. A zip archive over
+    the EXTRACT_ZIP_* limits fails the whole request with a 413.
+    """
+    print(f"Extract prescription batch endpoint called with {len(files)} files")  # Debug log
+    os.makedirs("static/temp", exist_ok=True)
+    batch_dir = tempfile.mkdtemp(prefix="extract_batch_", dir="static/temp")
+    executor = executors["extract_batch"]
+    # Keep every worker busy without queueing the whole batch at once
+    window = min(2 * executor.max_workers, executor.capacity)
+
+    in_flight = {}
+    try:
+        documents = await run_in_threadpool(stage_extract_uploads, files, batch_dir)
+        if len(documents) >= EXTRACT_BATCH_MAX_FILES:
+            logger.warning(f"Extract batch reached the limit of {EXTRACT_BATCH_MAX_FILES} documents")
+        pending = [(index, filename, path) for index, (filename, path, error) in enumerate(documents) if path]
+        pending.reverse()
+
+        # Admit the first document here, so a full pool is still a 503 rather than a broken stream
+        if pending:
+            index, filename, path = pending[-1]
+            in_flight[executor.submit(extract_medical_data, path, save=False)] = (index, filename, time.perf_counter())
+            pending.pop()
+    except Exception:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Extracting {len(documents)} documents in batch")
+
+    async def result_lines():
+        start = time.perf_counter()
+        counts = {"ok": 0, "error": 0}
+        try:
+            for index, (filename, path, error) in enumerate(documents):
+                if path is None:
+                    counts["error"] += 1
+                    yield json.dumps({"index": index, "filename": filename, "status": "error", "error": error}) + "\n"
+
+            while pending or in_flight:
+                while pending and len(in_flight) < window:
+                    index, filename, path = pending[-1]
+                    try:
+                        future = executor.submit(extract_medical_data, path, save=False)
+                    except ExecutorBusyError:
+                        break  # Other requests hold the queue; retry when one of ours finishes
+                    in_flight[future] = (index, filename, time.perf_counter())
+                    pending.pop()
+                if not in_flight:
+                    await asyncio.sleep(0.1)
+                    continue
 
-# ✅ Serve images from "temp" instead of "static"
-app.mount("/static/temp", StaticFiles(directory="temp"), name="temp")
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    index, filename, started = in_flight.pop(future)
+                    line = {"index": index, "filename": filename}
+                    try:
+                        line.update(status="ok", data=future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing PDF {filename}: {str(e)}")
+                        line.update(status="error", error=str(e))
+                    line["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                    counts[line["status"]] += 1
+                    yield json.dumps(line) + "\n"
+
+            summary = {"documents": len(documents), **counts, "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+            logger.info(f"Extract batch finished: {summary}")
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            # Also reached when the client disconnects: drop queued documents
+            for future in in_flight:
+                future.cancel()
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Annotated images are served from the artifact store by content hash
+@app.get("/api/artifacts/{key}", name="get_artifact")
+async def get_artifact(key: str, request: Request):
+    path = artifact_store.path(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found or expired")
+
+    # Content-addressed: the key is the ETag and the bytes never change
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+def artifact_url(request: Request, key: str) -> str:
+    """Absolute URL of an artifact, built from the host the client used"""
+    return str(request.url_for("get_artifact", key=key))
 
 @app.post("/api/analyze-xray")
-async def analyze_xray(file: UploadFile = File(...)):
+async def analyze_xray(
+    request: Request,
+    file: UploadFile = File(...),
+    conf: float = Query(xray_analyzer.DEFAULT_CONF, ge=0.0, le=1.0, description="Minimum detection confidence"),
+    iou: float = Query(xray_analyzer.DEFAULT_IOU, gt=0.0, le=1.0, description="NMS IoU threshold"),
+    max_det: int = Query(xray_analyzer.DEFAULT_MAX_DET, ge=1, le=1000, description="Maximum detections per image")
+):
     print("Analyze X-ray endpoint called")  # Debug log
 
     if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
         print("Invalid file type for X-ray analysis")  # Debug log
         raise HTTPException(status_code=400, detail="Only image files (PNG, JPG, JPEG) are supported")
 
-    # ✅ Ensure static/temp exists
-    os.makedirs("static/temp", exist_ok=True)
-
-    # ✅ Save uploaded file in static/temp
-    temp_file_path = f"static/temp/{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Keep the upload in memory; it is decoded once and never written to disk
+    image_bytes = await file.read()
 
     try:
         # Analyze X-ray image (which also saves the processed image)
         logger.info(f"Analyzing X-ray image: {file.filename}")
         print(f"Analyzing X-ray image: {file.filename}")  # Debug log
-        detections = analyze_xray_image(temp_file_path)
-
-        # ✅ Save the processed image in static/temp
-        output_image_path = "static/temp/output.jpg"
+        # Run on the X-ray executor so concurrent uploads can be micro-batched together
+        result = await executors["xray"].run(analyze_xray_image, image_bytes, conf=conf, iou=iou, max_det=max_det)
+        detections = result["detections"]
 
         logger.info(f"X-ray analysis results: {len(detections)} detections")
         print(f"X-ray analysis results: {len(detections)} detections")  # Debug log
@@ -190,18 +443,99 @@ async def analyze_xray(file: UploadFile = File(...)):
         # ✅ Return detection details and image URL
         return {
             "detections": detections,
-            "image_url": f"http://localhost:8000/static/temp/output.jpg"
+            "image_url": artifact_url(request, result["annotated_image"])
         }
 
+    except ExecutorBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing X-ray: {str(e)}")
         print(f"Error analyzing X-ray: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Error analyzing X-ray: {str(e)}")
 
-    finally:
-        # ✅ Remove the uploaded file after processing (optional)
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+@app.post("/api/analyze-xray/batch")
+async def analyze_xray_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    conf: float = Query(xray_analyzer.DEFAULT_CONF, ge=0.0, le=1.0, description="Minimum detection confidence"),
+    iou: float = Query(xray_analyzer.DEFAULT_IOU, gt=0.0, le=1.0, description="NMS IoU threshold"),
+    max_det: int = Query(xray_analyzer.DEFAULT_MAX_DET, ge=1, le=1000, description="Maximum detections per image")
+):
+    print(f"Analyze X-ray batch endpoint called with {len(files)} files")  # Debug log
+
+    for file in files:
+        if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            print(f"Invalid file type for X-ray analysis: {file.filename}")  # Debug log
+            raise HTTPException(status_code=400, detail=f"Only image files (PNG, JPG, JPEG) are supported: {file.filename}")
+
+    # Keep the uploads in memory; each is decoded once and never written to disk
+    images = [await file.read() for file in files]
+
+    try:
+        logger.info(f"Analyzing {len(files)} X-ray images in batch")
+        results = await executors["xray"].run(analyze_xray_images, images, conf=conf, iou=iou, max_det=max_det)
+
+        return {
+            "results": [
+                {
+                    "filename": file.filename,
+                    "detections": result["detections"],
+                    "image_url": artifact_url(request, result["annotated_image"])
+                }
+                for file, result in zip(files, results)
+            ]
+        }
+
+    except ExecutorBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error analyzing X-ray batch: {str(e)}")
+        print(f"Error analyzing X-ray batch: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Error analyzing X-ray batch: {str(e)}")
+
+# 3. Dental Photo Analysis Endpoint
+@app.post("/api/analyze-photo")
+async def analyze_photo(
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Classify one photo (``file``) or all photos of a visit (``files``) in one request
+
+    A single ``file`` returns one result object; ``files`` returns
+    {"results": [...]} with one entry per photo, in upload order.
+    """
+    uploads = ([file] if file else []) + (files or [])
+    print(f"Analyze photo endpoint called with {len(uploads)} files")  # Debug log
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No photo uploaded")
+
+    for upload in uploads:
+        if not upload.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            print(f"Invalid file type for photo analysis: {upload.filename}")  # Debug log
+            raise HTTPException(status_code=400, detail=f"Only image files (PNG, JPG, JPEG) are supported: {upload.filename}")
+
+    # Keep the uploads in memory; they are decoded in parallel by the analyzer
+    images = [await upload.read() for upload in uploads]
+
+    try:
+        logger.info(f"Analyzing {len(images)} dental photos")
+        results = await executors["photo"].run(analyze_dental_photos, images)
+    except ExecutorBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error analyzing photos: {str(e)}")
+        print(f"Error analyzing photos: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Error analyzing photos: {str(e)}")
+
+    if file and not files:
+        return results[0]
+    return {
+        "results": [
+            {"filename": upload.filename, **result}
+            for upload, result in zip(uploads, results)
+        ]
+    }
 
 # 4. Treatment Plan Generation Endpoint
 @app.post("/api/treatment-plan")
@@ -211,7 +545,8 @@ async def create_treatment_plan(patient_data: PatientData):
         # Generate treatment plan
         logger.info(f"Generating treatment plan for patient: {patient_data.name}")
         print(f"Generating treatment plan for patient: {patient_data.name}")  # Debug log
-        treatment_plan = generate_treatment_plan(
+        treatment_plan = await executors["treatment"].run(
+            generate_treatment_plan,
             patient_data.dict(),
             xray_findings=patient_data.xrayFindings,
             photo_findings=patient_data.photoFindings
@@ -220,6 +555,8 @@ async def create_treatment_plan(patient_data: PatientData):
         logger.info(f"Treatment plan generated: {treatment_plan['diagnosis']}")
         print(f"Treatment plan generated: {treatment_plan['diagnosis']}")  # Debug log
         return treatment_plan
+    except ExecutorBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error generating treatment plan: {str(e)}")
         print(f"Error generating treatment plan: {str(e)}")  # Debug log
@@ -230,36 +567,8 @@ async def create_treatment_plan(patient_data: PatientData):
 async def save_patient(patient: PatientRecord):
     print("Save patient endpoint called")  # Debug log
     try:
-        # In a real application, you would save to a database
-        # For this example, we'll save to a JSON file
-        
-        # Generate a unique ID for the patient
-        patient_id = f"P{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Add the patient ID to the record
-        patient_dict = patient.dict()
-        patient_dict["id"] = patient_id
-        patient_dict["createdAt"] = datetime.now().isoformat()
-        
-        # Save to a JSON file (in a real app, save to database)
-        patients_file = "data/patients.json"
-        
-        # Create data directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-        
-        # Load existing patients or create empty list
-        if os.path.exists(patients_file):
-            with open(patients_file, "r") as f:
-                patients = json.load(f)
-        else:
-            patients = []
-        
-        # Add new patient
-        patients.append(patient_dict)
-        
-        # Save updated list
-        with open(patients_file, "w") as f:
-            json.dump(patients, f, indent=2)
+        # One indexed insert into the patient database; the ID is generated by the store
+        patient_id = await run_in_threadpool(patient_store.add, patient.dict())
         
         logger.info(f"Patient record saved with ID: {patient_id}")
         print(f"Patient record saved with ID: {patient_id}")  # Debug log
@@ -269,23 +578,135 @@ async def save_patient(patient: PatientRecord):
         print(f"Error saving patient record: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Error saving patient record: {str(e)}")
 
-# Debug endpoint to check model paths
-@app.get("/api/debug/model-paths")
-async def debug_model_paths():
-    print("Debug model paths endpoint called")  # Debug log
-    from models.xray_analyzer import MODEL_PATH as XRAY_MODEL_PATH
-    from models.photo_analyzer import MODEL_PATH as PHOTO_MODEL_PATH
-    
-    xray_model_exists = os.path.exists(XRAY_MODEL_PATH)
-    photo_model_exists = os.path.exists(PHOTO_MODEL_PATH)
-    
+# 6. Dental Knowledge Chatbot Endpoint
+@app.post("/api/chat")
+async def chat(request: ChatRequest):
+    print(f"Chat endpoint called: {request.question}")  # Debug log
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    if chat_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Chat service is not available ({chat_status['state']})",
+            headers={"Retry-After": "5"}
+        )
+
+    try:
+        result = await executors["chat"].run(chat_service.answer, request.question, k=request.k)
+        logger.info(f"Chat answered in {result['timings_ms']['total']} ms: {result['timings_ms']}")
+        return result
+    except ExecutorBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error answering chat question: {str(e)}")
+        print(f"Error answering chat question: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Error answering chat question: {str(e)}")
+
+# 7. Streaming Chatbot Endpoint (Server-Sent Events)
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    print(f"Chat stream endpoint called: {request.question}")  # Debug log
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    if chat_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Chat service is not available ({chat_status['state']})",
+            headers={"Retry-After": "5"}
+        )
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        # Runs on a chat worker thread; hands each event to the response generator
+        events = None
+        try:
+            events = chat_service.stream(request.question, k=request.k, cancelled=cancelled)
+            for event in events:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+                if cancelled.is_set():
+                    break
+        except Exception as e:
+            logger.error(f"Error streaming chat answer: {str(e)}")
+            loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "detail": str(e)})
+        finally:
+            if events is not None:
+                events.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    def producer_done(future):
+        # Runs on the event loop; anything produce() let escape still ends the stream instead of hanging it
+        if future.cancelled():
+            error = "Chat stream was cancelled"
+        elif future.exception() is not None:
+            error = f"Error streaming chat answer: {str(future.exception())}"
+        else:
+            return
+        logger.error(error)
+        queue.put_nowait({"type": "error", "detail": error})
+        queue.put_nowait(None)
+
+    # Admission happens here, so a full queue is still a 503 rather than a broken stream
+    producer = executors["chat"].submit(produce)
+    producer.add_done_callback(producer_done)
+
+    async def event_stream():
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                if event["type"] == "done":
+                    logger.info(f"Chat streamed: {event['metrics']}")
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Also reached when the client disconnects: stop generating
+            cancelled.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Readiness probe: passes once every model is loaded and warmed up
+@app.get("/ready")
+async def ready():
+    all_ready = all(status["ready"] for status in model_status.values())
+    return JSONResponse(
+        status_code=200 if all_ready else 503,
+        content={"ready": all_ready, "models": model_status, "chat": chat_status}
+    )
+
+# Debug endpoint to inspect micro-batching metrics
+@app.get("/api/debug/batching")
+async def debug_batching():
     return {
-        "xray_model_path": XRAY_MODEL_PATH,
-        "xray_model_exists": xray_model_exists,
-        "photo_model_path": PHOTO_MODEL_PATH,
-        "photo_model_exists": photo_model_exists
+        "xray": xray_analyzer.batcher.stats(),
+        "photo": photo_analyzer.batcher.stats(),
+        "executors": {name: executor.stats() for name, executor in executors.items()}
     }
 
+# Debug endpoint to inspect the analysis result caches
+@app.get("/api/debug/cache")
+async def debug_cache():
+    return {
+        "xray": xray_analyzer.result_cache.stats(),
+        "photo": photo_analyzer.result_cache.stats(),
+        "artifacts": artifact_store.stats(),
+        "extract": extraction_cache.stats(),
+        "extract_audit": audit_sink.stats()
+    }
+
+# Debug endpoint to inspect the chatbot's embedding and answer caches
+@app.get("/api/debug/chat-cache")
+async def debug_chat_cache():
+    if chat_service is None:
+        return {"chat": chat_status}
+    return chat_service.cache_stats()
+
 if __name__ == "__main__":
     print("Starting server...")  # Debug log
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,147 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default settings, overridable per deployment
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join("static", "artifacts"))
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+ARTIFACT_MAX_AGE = float(os.environ.get("ARTIFACT_MAX_AGE", str(24 * 3600)))
+ARTIFACT_EVICT_INTERVAL = float(os.environ.get("ARTIFACT_EVICT_INTERVAL", "60"))  # Seconds between age sweeps
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for generated files such as annotated X-rays
+
+    Each artifact is saved under the sha256 of its bytes, so concurrent
+    requests never overwrite each other and identical outputs are stored once.
+    Artifacts older than ``max_age_seconds`` are evicted, then the least
+    recently written ones until the store fits in ``max_bytes``.
+
+    Uploads sweep for expired artifacts at most every ``evict_interval_seconds``,
+    and a size eviction frees 10% headroom so the next uploads skip it.
+    Reads check the artifact's own age, so an expired one is never served.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, max_bytes=ARTIFACT_MAX_BYTES, max_age_seconds=ARTIFACT_MAX_AGE,
+                 extension=".jpg", evict_interval_seconds=ARTIFACT_EVICT_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.extension = extension
+        self.evict_interval_seconds = evict_interval_seconds
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (size, mtime)
+        self._total_bytes = 0
+        self._last_sweep = 0.0
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        # Pick up artifacts left by a previous run or another worker process
+        for file_name in os.listdir(self.root):
+            key, extension = os.path.splitext(file_name)
+            if extension != self.extension or not KEY_PATTERN.match(key):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, file_name))
+            except OSError:
+                continue
+            self._entries[key] = (stat.st_size, stat.st_mtime)
+            self._total_bytes += stat.st_size
+
+    def path(self, key):
+        """Return the file path for a key, or None if the key is invalid, missing or expired"""
+        if not KEY_PATTERN.match(key):
+            return None
+        path = os.path.join(self.root, key + self.extension)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        if time.time() - mtime > self.max_age_seconds:
+            # Expired since the last sweep: drop it now rather than wait for the next upload
+            with self._lock:
+                if key in self._entries:
+                    self._remove_locked(key)
+                else:
+                    self._remove_file(key)
+            return None
+        return path
+
+    def put(self, data):
+        """Store bytes and return their key"""
+        key = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.root, key + self.extension)
+        now = time.time()
+
+        if os.path.exists(path):
+            # Same content already stored: refresh its age instead of rewriting
+            os.utime(path, (now, now))
+        else:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._entries[key] = (len(data), now)
+            self._total_bytes += len(data)
+            # Sweeping walks every entry, so uploads only do it once per interval or when over the size limit
+            if now - self._last_sweep >= self.evict_interval_seconds or self._total_bytes > self.max_bytes:
+                self._evict_locked(now)
+        return key
+
+    def _evict_locked(self, now):
+        self._last_sweep = now
+        expired = [key for key, (_, mtime) in self._entries.items() if now - mtime > self.max_age_seconds]
+        for key in expired:
+            self._remove_locked(key)
+
+        if self._total_bytes > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+                if self._total_bytes <= target:
+                    break
+                self._remove_locked(key)
+
+    def _remove_locked(self, key):
+        size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(os.path.join(self.root, key + self.extension))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Apply the age and size limits now"""
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "root": self.root,
+                "artifacts": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "evict_interval_seconds": self.evict_interval_seconds,
+            }
+
+
+# Shared store for annotated X-ray images
+artifact_store = ArtifactStore()
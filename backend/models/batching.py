@@ -0,0 +1,130 @@
+import threading
+import queue
+import time
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Group concurrent single-item requests into one batched call
+
+    Callers submit one item at a time and block on the returned future. A
+    background worker collects up to ``max_batch_size`` items, waiting at most
+    ``max_wait_ms`` after the first item arrives, and hands them to
+    ``batch_fn`` in a single call. ``batch_fn`` must return one result per
+    item, in order; an exception instance in the results is raised to that
+    item's caller only.
+
+    Per-batch size and queue-wait metrics are logged and accumulated; read them
+    with ``stats()``.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10, name="batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = {}
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._last_batch = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+                self._worker.start()
+
+    def submit(self, item):
+        """Queue one item and return a future for its result"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item):
+        """Submit one item and block until its result is ready"""
+        return self.submit(item).result()
+
+    def _collect(self):
+        # Block for the first item, then drain until the batch is full or the deadline passes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _record_batch(self, enqueue_times):
+        now = time.monotonic()
+        waits = [now - enqueued for enqueued in enqueue_times]
+        size = len(waits)
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._last_batch = {
+                "size": size,
+                "max_queue_wait_ms": round(max(waits) * 1000, 2),
+                "mean_queue_wait_ms": round(sum(waits) / size * 1000, 2),
+            }
+        logger.info(f"{self.name}: batch size {size}, queue wait max {self._last_batch['max_queue_wait_ms']} ms")
+
+    def stats(self):
+        """Return accumulated batch size and queue-wait metrics"""
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "mean_queue_wait_ms": round(self._total_wait / self._items * 1000, 2) if self._items else 0.0,
+                "max_queue_wait_ms": round(self._max_wait_seen * 1000, 2),
+                "last_batch": self._last_batch,
+            }
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            self._record_batch([enqueued for _, _, enqueued in batch])
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: expected {len(items)} results, got {len(results)}")
+            except Exception as e:
+                logger.error(f"{self.name}: batch of {len(items)} failed: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            logger.debug(f"{self.name}: processed batch of {len(items)}")
+            for future, result in zip(futures, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
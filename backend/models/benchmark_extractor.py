@@ -0,0 +1,192 @@
+"""
+Compare the prescription field extractor with the original version, on
+multi-page medical records.
+
+Checks that both give identical fields, then reports ms per document for
+the whole extraction (PDF parsing + field matching; each page is now parsed
+once) and for field matching alone (precompiled patterns), and for lazy page scanning, which stops parsing once every field is
+found (``lazy_ms``, with the pages it parsed; only the default
+REQUIRED_FIELDS, without the page cap or time budget).
+
+Usage (from the backend directory):
+    python -m models.benchmark_extractor                      # generated 1-40 page records
+    python -m models.benchmark_extractor path/to/record.pdf ...
+    python -m models.benchmark_extractor --pages 1 10 80 --json report.json
+    python -m models.benchmark_extractor --omit "Doctor's Notes"   # records missing an optional field
+"""
+import os
+import re
+import time
+import json
+import random
+import argparse
+import tempfile
+
+from pypdf import PdfReader
+
+from models.prescription_extractor import FIELD_PATTERNS, REQUIRED_FIELDS, extract_fields, read_pdf_text, scan_pdf_fields
+
+FILLER_LINES = [
+    "Follow-up visit. Gingiva mildly inflamed around the lower molars.",
+    "Dosage: 500 mg amoxicillin three times daily for 5 days.",
+    "Periodontal charting shows 4 mm pockets on teeth 36 and 37.",
+    "Radiograph reviewed, no periapical lesions noted.",
+    "Patient advised to use a soft-bristled brush and floss daily.",
+    "Next appointment scheduled in three weeks for scaling.",
+]
+
+# ------------------------------
+# 1️⃣ Original Extractor (reference)
+# ------------------------------
+def legacy_read_pdf_text(pdf_path):
+    pdf_reader = PdfReader(pdf_path)
+    return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+
+def legacy_extract_field(text, pattern, default=""):
+    match = re.search(pattern, text, re.IGNORECASE)
+    return match.group(1).strip() if match else default
+
+def legacy_extract_fields(text):
+    patient_info = {
+        "Name": legacy_extract_field(text, r"Patient Name:\s*(.*)", ""),
+        "Age": legacy_extract_field(text, r"Age:\s*(\d+)", ""),
+        "Gender": legacy_extract_field(text, r"Gender:\s*(.*)", ""),
+        "Blood Group": legacy_extract_field(text, r"Blood Group:\s*(.*)", ""),
+        "Allergies": legacy_extract_field(text, r"Allergies:\s*(.*)", ""),
+        "Existing Conditions": legacy_extract_field(text, r"Existing Conditions:\s*(.*)", ""),
+        "Current Medications": legacy_extract_field(text, r"Current Medications:\s*(.*)", ""),
+        "Doctor's Notes": legacy_extract_field(text, r"Doctor's Notes:\s*(.*)", ""),
+        "Previous Dental Procedures": legacy_extract_field(text, r"Previous Dental Procedures:\s*(.*)", ""),
+    }
+    if not patient_info["Name"]:
+        for pattern in [r"Name:\s*(.*)", r"Patient:\s*(.*)", r"Patient Information\s*\n\s*(.*)", r"PATIENT NAME:\s*(.*)"]:
+            name = legacy_extract_field(text, pattern, "")
+            if name:
+                patient_info["Name"] = name
+                break
+    return patient_info
+
+# ------------------------------
+# 2️⃣ Sample Records
+# ------------------------------
+def record_pages(num_pages, seed=0, omit=()):
+    """Lines of a medical record: the fields on page 1 (except those in omit), clinical notes after it."""
+    rng = random.Random(seed)
+    first_page = [
+        "Patient Information",
+        f"Patient Name: Jane Roe {seed}",
+        f"Age: {20 + seed % 60}",
+        "Gender: Female",
+        "Blood Group: O+",
+        "Allergies: Penicillin",
+        "Existing Conditions: Type 2 diabetes",
+        "Current Medications: Metformin 500 mg",
+        "Doctor's Notes: Sensitivity on upper left quadrant",
+        "Previous Dental Procedures: Root canal (2021)",
+    ]
+    first_page = [line for line in first_page if line.split(":")[0] not in omit]
+    return [first_page] + [[rng.choice(FILLER_LINES) for _ in range(45)] for _ in range(num_pages - 1)]
+
+def _pdf_string(line):
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def write_pdf(path, pages):
+    """Write a minimal text-only PDF (Helvetica, one line per Tj) that pypdf can read."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 14 TL 50 760 Td " + " T* ".join(f"{_pdf_string(line)} Tj" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+# ------------------------------
+# 3️⃣ Measurements
+# ------------------------------
+def ms_per_call(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def run_benchmark(pdf_paths, repeat=5):
+    rows = []
+    for pdf_path in pdf_paths:
+        text = read_pdf_text(pdf_path)
+        legacy = legacy_extract_fields(legacy_read_pdf_text(pdf_path))
+        current = extract_fields(text)
+        scanner, _, _ = scan_pdf_fields(pdf_path, required_fields=list(FIELD_PATTERNS), max_pages=0, time_budget_s=0)
+        _, extraction, _ = scan_pdf_fields(pdf_path, required_fields=REQUIRED_FIELDS, max_pages=0, time_budget_s=0)
+
+        legacy_ms = ms_per_call(lambda path: legacy_extract_fields(legacy_read_pdf_text(path)), pdf_path, repeat)
+        parse_once_ms = ms_per_call(lambda path: extract_fields(read_pdf_text(path)), pdf_path, repeat)
+        legacy_match_ms = ms_per_call(legacy_extract_fields, text, repeat * 200)
+        precompiled_match_ms = ms_per_call(extract_fields, text, repeat * 200)
+        lazy_ms = ms_per_call(lambda path: scan_pdf_fields(path, REQUIRED_FIELDS, 0, 0)[0].result(), pdf_path, repeat)
+        rows.append({
+            "file": os.path.basename(pdf_path),
+            "pages": len(PdfReader(pdf_path).pages),
+            "identical": legacy == current == scanner.result(),
+            "legacy_ms": round(legacy_ms, 2),
+            "parse_once_ms": round(parse_once_ms, 2),
+            "speedup": round(legacy_ms / parse_once_ms, 2),
+            "legacy_match_ms": round(legacy_match_ms, 3),
+            "precompiled_match_ms": round(precompiled_match_ms, 3),
+            "match_speedup": round(legacy_match_ms / precompiled_match_ms, 2),
+            "pages_parsed": extraction["pages_parsed"],
+            "lazy_ms": round(lazy_ms, 2),
+            "lazy_speedup": round(legacy_ms / lazy_ms, 2),
+        })
+    return rows
+
+def print_report(rows):
+    columns = ["pages", "identical", "legacy_ms", "parse_once_ms", "speedup",
+               "legacy_match_ms", "precompiled_match_ms", "match_speedup", "pages_parsed", "lazy_ms", "lazy_speedup"]
+    print(f"{'file':<24}" + "".join(f"{column:>22}" for column in columns))
+    for row in rows:
+        print(f"{row['file'][:23]:<24}" + "".join(f"{str(row[column]):>22}" for column in columns))
+
+# ------------------------------
+# 4️⃣ Main Execution
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the prescription field extractor")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to benchmark (default: generated records)")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 2, 10, 40], help="Page counts of generated records")
+    parser.add_argument("--omit", nargs="+", default=[], help="Fields left out of generated records")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_paths = args.pdfs
+        if not pdf_paths:
+            for num_pages in args.pages:
+                pdf_path = os.path.join(tmp_dir, f"record_{num_pages}p.pdf")
+                write_pdf(pdf_path, record_pages(num_pages, seed=num_pages, omit=args.omit))
+                pdf_paths.append(pdf_path)
+
+        rows = run_benchmark(pdf_paths, repeat=args.repeat)
+
+    print_report(rows)
+    if not all(row["identical"] for row in rows):
+        print("⚠️ Extracted fields differ from the original extractor")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Report saved to {args.json}")
@@ -0,0 +1,145 @@
+"""
+Insert latency of the SQLite patient store as the number of patients grows,
+next to the old rewrite-the-whole-JSON-file save.
+
+At each size the store is first filled in bulk, then ``--samples`` single
+saves are timed the way /api/patients makes them (one record, one commit).
+The JSON baseline is only run up to ``--json-max`` patients, since every
+save rewrites the whole file.
+
+Usage (from the backend directory):
+    python -m models.benchmark_patient_store                       # 1k, 10k, 100k, 1M patients
+    python -m models.benchmark_patient_store --sizes 1000 10000 --json report.json
+
+1M patients take about 1 GB of disk in the temporary directory.
+"""
+import os
+import time
+import json
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+from models.patient_store import PatientStore
+
+FIRST_NAMES = ["Anna", "Ravi", "Mei", "John", "Fatima", "Lucas", "Aisha", "Omar", "Sara", "Ken"]
+LAST_NAMES = ["Kumar", "Smith", "Nair", "Garcia", "Chen", "Okafor", "Rossi", "Haddad", "Silva", "Ito"]
+
+# ------------------------------
+# 1️⃣ Sample Records
+# ------------------------------
+def sample_record(rng):
+    """A patient record shaped like the PatientRecord the frontend posts."""
+    first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "firstName": first_name,
+        "lastName": last_name,
+        "dob": f"{rng.randint(1940, 2015)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "gender": rng.choice(["Male", "Female"]),
+        "bloodGroup": rng.choice(["A+", "B+", "O+", "AB-"]),
+        "phone": f"+91{rng.randint(6000000000, 9999999999)}",
+        "email": f"{first_name}.{last_name}{rng.randint(1, 99999)}@example.com".lower(),
+        "address": f"{rng.randint(1, 999)} Main Road",
+        "emergencyContact": None,
+        "allergies": rng.choice(["None", "Penicillin", "Latex"]),
+        "existingConditions": rng.choice(["None", "Diabetes", "Hypertension"]),
+        "currentMedications": [{"name": "Metformin", "dosage": "500 mg", "frequency": "twice daily", "duration": ""}],
+        "previousDentalProcedures": "Root canal",
+        "notes": "Sensitivity on upper left quadrant",
+        "xrayAnalysis": None,
+        "photoAnalysis": None,
+        "treatmentPlan": None,
+    }
+
+# ------------------------------
+# 2️⃣ Measurements
+# ------------------------------
+def latency_row(backend, size, latencies_s):
+    latencies_ms = np.array(latencies_s) * 1000
+    return {
+        "backend": backend,
+        "patients": size,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+    }
+
+def bench_sqlite(sizes, samples, work_dir, seed=0, bulk_batch=10000):
+    rng = random.Random(seed)
+    store = PatientStore(path=os.path.join(work_dir, "patients.sqlite3"), legacy_file=None)
+    rows = []
+    for size in sorted(sizes):
+        # Fill up to the target size, then time single saves like the endpoint makes
+        while store.count() < size:
+            store.add_many([sample_record(rng) for _ in range(min(bulk_batch, size - store.count()))])
+        latencies = []
+        for _ in range(samples):
+            record = sample_record(rng)
+            start = time.perf_counter()
+            store.add(record)
+            latencies.append(time.perf_counter() - start)
+        row = latency_row("sqlite", size, latencies)
+        start = time.perf_counter()
+        store.find(last_name="Kumar", first_name="Anna", limit=20)
+        row["lookup_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        rows.append(row)
+        print(f"✅ sqlite {size:>9} patients: p50 {row['p50_ms']} ms, p99 {row['p99_ms']} ms")
+    return rows
+
+def json_save(patients_file, record):
+    """The old /api/patients save: load the whole file, append, rewrite it."""
+    with open(patients_file, "r") as f:
+        patients = json.load(f)
+    patients.append(record)
+    with open(patients_file, "w") as f:
+        json.dump(patients, f, indent=2)
+
+def bench_json(sizes, samples, work_dir, seed=0):
+    rng = random.Random(seed)
+    patients_file = os.path.join(work_dir, "patients.json")
+    rows = []
+    for size in sorted(sizes):
+        with open(patients_file, "w") as f:
+            json.dump([sample_record(rng) for _ in range(size)], f, indent=2)
+        latencies = []
+        for _ in range(samples):
+            record = sample_record(rng)
+            start = time.perf_counter()
+            json_save(patients_file, record)
+            latencies.append(time.perf_counter() - start)
+        row = latency_row("json", size, latencies)
+        rows.append(row)
+        print(f"✅ json   {size:>9} patients: p50 {row['p50_ms']} ms, p99 {row['p99_ms']} ms")
+    return rows
+
+def print_report(rows):
+    columns = ["patients", "p50_ms", "p99_ms", "mean_ms", "lookup_ms"]
+    print(f"{'backend':<10}" + "".join(f"{column:>14}" for column in columns))
+    for row in rows:
+        print(f"{row['backend']:<10}" + "".join(f"{str(row.get(column, '-')):>14}" for column in columns))
+
+# ------------------------------
+# 3️⃣ Main Execution
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Insert latency of the patient store from 1k to 1M patients")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--samples", type=int, default=200, help="Single saves timed at each size")
+    parser.add_argument("--json-max", type=int, default=10000, help="Largest size for the JSON file baseline")
+    parser.add_argument("--dir", help="Work directory (default: a temporary directory)")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as work_dir:
+        rows = bench_sqlite(args.sizes, args.samples, work_dir)
+        json_sizes = [size for size in args.sizes if size <= args.json_max]
+        if json_sizes:
+            rows += bench_json(json_sizes, min(args.samples, 20), work_dir)
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Report saved to {args.json}")
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusyError(Exception):
+    """Raised when an executor's pending queue is full"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} executor is busy, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Run blocking model calls off the event loop with bounded admission
+
+    At most ``max_workers`` calls run at once and at most ``max_pending`` more
+    wait for a worker. Anything beyond that is rejected immediately with
+    ``ExecutorBusyError`` so latency cannot grow without limit.
+
+    ``kind`` is "thread" or "process". Thread pools share the loaded model and
+    its micro-batcher; process pools load one model per worker process and
+    isolate the GIL, at the cost of memory and cross-request batching.
+    ``initializer`` runs once in every worker process (e.g. to preload the
+    model); it is ignored for thread pools, which share the parent's model.
+    """
+
+    def __init__(self, name, kind="thread", max_workers=2, max_pending=16, initializer=None, initargs=()):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind for {name}: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(0, int(max_pending))
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._avg_duration = None
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_pending
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    # Spawn avoids forking a parent that may already hold torch threads
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=self.initializer,
+                        initargs=self.initargs
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            return self._pool
+
+    def retry_after(self):
+        """Estimate in whole seconds how long until a slot frees up"""
+        if self._avg_duration is None:
+            return 1
+        waves = self.capacity / self.max_workers
+        return max(1, int(round(self._avg_duration * waves)))
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.capacity:
+                self._rejected += 1
+                raise ExecutorBusyError(self.name, self.retry_after())
+            self._admitted += 1
+
+    def _release(self, duration):
+        with self._lock:
+            self._admitted -= 1
+            self._completed += 1
+            # Exponential moving average of call duration, used for Retry-After
+            if self._avg_duration is None:
+                self._avg_duration = duration
+            else:
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Admit ``fn(*args, **kwargs)`` now and return an asyncio future for its result
+
+        Raises ``ExecutorBusyError`` immediately when the queue is full, so
+        callers can reject a request before they start responding.
+        """
+        self._admit()
+        start = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_pool(), partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(time.monotonic() - start)
+            raise
+        future.add_done_callback(lambda _: self._release(time.monotonic() - start))
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result"""
+        return await self.submit(fn, *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._admitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_duration_s": round(self._avg_duration, 3) if self._avg_duration is not None else None,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def executor_from_env(name, kind="thread", max_workers=2, max_pending=16, initializer=None, initargs=()):
+    """
+    Build an executor whose settings can be overridden per model, e.g.
+    XRAY_EXECUTOR=process, XRAY_WORKERS=4, XRAY_MAX_PENDING=32
+    """
+    prefix = name.upper()
+    return InferenceExecutor(
+        name,
+        kind=os.environ.get(f"{prefix}_EXECUTOR", kind),
+        max_workers=int(os.environ.get(f"{prefix}_WORKERS", max_workers)),
+        max_pending=int(os.environ.get(f"{prefix}_MAX_PENDING", max_pending)),
+        initializer=initializer,
+        initargs=initargs,
+    )
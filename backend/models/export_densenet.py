@@ -0,0 +1,158 @@
+"""
+Export the DenseNet photo classifier to ONNX and an int8-quantized ONNX model,
+and compare the backends on a validation folder.
+
+Usage (from the backend directory):
+    python -m models.export_densenet export
+    python -m models.export_densenet export --weights path/to/weights.pth
+    python -m models.export_densenet report path/to/validation
+
+The validation folder holds one subfolder per class label, e.g.
+validation/Caries/*.jpg, validation/Ulcers/*.jpg.
+"""
+import os
+import time
+import json
+import argparse
+
+import torch
+from PIL import Image
+
+from models.photo_analyzer import (
+    BACKENDS,
+    MODEL_PATH,
+    ONNX_MODEL_PATH,
+    ONNX_INT8_MODEL_PATH,
+    class_labels,
+    build_model,
+    test_transform,
+    _classify_batch,
+)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def export_onnx(weights_path=MODEL_PATH, onnx_path=ONNX_MODEL_PATH, opset=17):
+    """Export the PyTorch weights to ONNX with a dynamic batch dimension"""
+    torch_model = build_model("torch", weights_path).cpu()
+    dummy = torch.zeros(1, 3, 128, 128)
+
+    torch.onnx.export(
+        torch_model,
+        dummy,
+        onnx_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    print(f"✅ Exported {weights_path} -> {onnx_path}")
+    return onnx_path
+
+
+def quantize_onnx(onnx_path=ONNX_MODEL_PATH, int8_path=ONNX_INT8_MODEL_PATH):
+    """Dynamically quantize the ONNX model's weights to int8"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"✅ Quantized {onnx_path} -> {int8_path}")
+    return int8_path
+
+
+def load_validation_set(val_dir):
+    """Return (image_path, label_index) pairs from one subfolder per class"""
+    samples = []
+    for label_idx, label in enumerate(class_labels):
+        label_dir = os.path.join(val_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for file_name in sorted(os.listdir(label_dir)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(label_dir, file_name), label_idx))
+    return samples
+
+
+def accuracy_report(val_dir, backends=("torch", "onnx", "onnx-int8"), batch_size=16):
+    """
+    Compare backends on a validation folder
+
+    Reports top-1 accuracy, agreement with the PyTorch predictions, the
+    probability delta against PyTorch and the mean latency per image.
+    """
+    samples = load_validation_set(val_dir)
+    if not samples:
+        raise ValueError(f"No validation images found under {val_dir}")
+
+    tensors = [test_transform(Image.open(path).convert("RGB")) for path, _ in samples]
+    labels = torch.tensor([label for _, label in samples])
+
+    probabilities = {}
+    report = {}
+    for backend in backends:
+        if not os.path.exists(BACKENDS[backend]):
+            print(f"⚠️ Skipping {backend}: {BACKENDS[backend]} not found")
+            continue
+        classifier = build_model(backend)
+
+        rows = []
+        start = time.perf_counter()
+        for i in range(0, len(tensors), batch_size):
+            rows.extend(_classify_batch(tensors[i:i + batch_size], classifier=classifier))
+        elapsed = time.perf_counter() - start
+
+        probs = torch.stack(rows)
+        probabilities[backend] = probs
+        report[backend] = {
+            "images": len(samples),
+            "accuracy": round((probs.argmax(dim=1) == labels).float().mean().item(), 4),
+            "ms_per_image": round(elapsed / len(samples) * 1000, 2),
+        }
+
+    # Deltas against the PyTorch reference
+    reference = probabilities.get("torch")
+    if reference is not None:
+        for backend, probs in probabilities.items():
+            delta = (probs - reference).abs()
+            report[backend].update({
+                "accuracy_delta": round(report[backend]["accuracy"] - report["torch"]["accuracy"], 4),
+                "agreement_with_torch": round((probs.argmax(dim=1) == reference.argmax(dim=1)).float().mean().item(), 4),
+                "max_probability_delta": round(delta.max().item(), 4),
+                "mean_probability_delta": round(delta.mean().item(), 6),
+            })
+
+    return report
+
+
+def print_report(report):
+    columns = ["accuracy", "accuracy_delta", "agreement_with_torch", "max_probability_delta", "ms_per_image"]
+    print(f"{'backend':<12}" + "".join(f"{column:>24}" for column in columns))
+    for backend, row in report.items():
+        print(f"{backend:<12}" + "".join(f"{str(row.get(column, '-')):>24}" for column in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and compare DenseNet photo classifier backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export ONNX and int8 ONNX models")
+    export_parser.add_argument("--weights", default=MODEL_PATH, help="PyTorch weights to export")
+    export_parser.add_argument("--opset", type=int, default=17)
+
+    report_parser = subparsers.add_parser("report", help="Accuracy-delta report on a validation folder")
+    report_parser.add_argument("val_dir")
+    report_parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    report_parser.add_argument("--batch-size", type=int, default=16)
+    report_parser.add_argument("--json", help="Also write the report to this JSON file")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(weights_path=args.weights, opset=args.opset)
+        quantize_onnx()
+    else:
+        report = accuracy_report(args.val_dir, backends=args.backends, batch_size=args.batch_size)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"✅ Report saved to {args.json}")
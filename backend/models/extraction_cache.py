@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import atexit
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default settings, overridable per deployment
+EXTRACT_CACHE_PATH = os.environ.get("EXTRACT_CACHE_PATH", os.path.join("data", "extract_cache.sqlite3"))  # Empty disables it
+EXTRACT_CACHE_MAX_BYTES = int(os.environ.get("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EXTRACT_AUDIT_LOG = os.environ.get("EXTRACT_AUDIT_LOG", "")  # JSON-lines audit trail; empty disables it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    text_version TEXT NOT NULL,
+    pages_total INTEGER,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents (last_used);
+CREATE TABLE IF NOT EXISTS pages (
+    sha256 TEXT NOT NULL,
+    page_no INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (sha256, page_no)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fields (
+    sha256 TEXT NOT NULL,
+    version TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    extraction TEXT NOT NULL,
+    PRIMARY KEY (sha256, version)
+) WITHOUT ROWID;
+"""
+
+
+class ExtractionCache:
+    """
+    Persistent cache of PDF page text and extracted fields, keyed by document hash
+
+    Entries live in one SQLite file in WAL mode, so the thread and process
+    workers of every extract executor share them. Page text is keyed by the
+    sha256 of the PDF bytes and the text extractor version; fields also by
+    the field extractor version, so new patterns re-match the cached text
+    instead of parsing the PDF again. Least recently used documents are
+    evicted once the cached text and fields exceed ``max_bytes``.
+
+    The cache never fails an extraction: database errors are logged and
+    treated as misses.
+    """
+
+    def __init__(self, path=EXTRACT_CACHE_PATH, max_bytes=EXTRACT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "page_hits": 0, "misses": 0, "evicted": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        # One connection per thread; the first one in each process creates the tables
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def _error(self, action, error):
+        logger.warning(f"Extraction cache: could not {action}: {str(error)}")
+        self._count("errors")
+
+    def get_fields(self, sha256, version):
+        """Return (fields, extraction) cached for this document and extractor version, or None"""
+        if not self.enabled:
+            return None
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT fields, extraction FROM fields WHERE sha256 = ? AND version = ?", (sha256, version)
+            ).fetchone()
+            if row is not None:
+                connection.execute("UPDATE documents SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        except sqlite3.Error as e:
+            self._error("read fields", e)
+            return None
+        if row is None:
+            return None
+        self._count("hits")
+        return json.loads(row[0]), json.loads(row[1])
+
+    def get_pages(self, sha256, text_version):
+        """Return (texts of the pages parsed so far, total pages or None); ([], None) when nothing is cached"""
+        if not self.enabled:
+            return [], None
+        try:
+            connection = self._connection()
+            document = connection.execute(
+                "SELECT pages_total FROM documents WHERE sha256 = ? AND text_version = ?", (sha256, text_version)
+            ).fetchone()
+            if document is None:
+                self._count("misses")
+                return [], None
+            rows = connection.execute(
+                "SELECT text FROM pages WHERE sha256 = ? ORDER BY page_no", (sha256,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self._error("read pages", e)
+            return [], None
+        self._count("page_hits")
+        return [row[0] for row in rows], document[0]
+
+    def put(self, sha256, version, text_version, page_texts, pages_total, fields, extraction):
+        """Store the page texts parsed so far and the fields extracted from them, then evict to fit max_bytes"""
+        if not self.enabled:
+            return
+        fields_json = json.dumps(fields)
+        extraction_json = json.dumps(extraction)
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                current = connection.execute("SELECT text_version FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+                if current is not None and current[0] != text_version:
+                    # Text from an older pypdf: replace it and every field result derived from it
+                    connection.execute("DELETE FROM pages WHERE sha256 = ?", (sha256,))
+                    connection.execute("DELETE FROM fields WHERE sha256 = ?", (sha256,))
+                connection.executemany(
+                    "INSERT OR IGNORE INTO pages (sha256, page_no, text) VALUES (?, ?, ?)",
+                    [(sha256, page_no, text) for page_no, text in enumerate(page_texts)]
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO fields (sha256, version, fields, extraction) VALUES (?, ?, ?, ?)",
+                    (sha256, version, fields_json, extraction_json)
+                )
+                size = connection.execute(
+                    "SELECT (SELECT COALESCE(SUM(LENGTH(text)), 0) FROM pages WHERE sha256 = ?)"
+                    " + (SELECT COALESCE(SUM(LENGTH(fields) + LENGTH(extraction)), 0) FROM fields WHERE sha256 = ?)",
+                    (sha256, sha256)
+                ).fetchone()[0]
+                connection.execute(
+                    "INSERT OR REPLACE INTO documents (sha256, text_version, pages_total, bytes, last_used)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (sha256, text_version, pages_total, size, time.time())
+                )
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self._error("store extraction", e)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(bytes), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for sha256, size in connection.execute("SELECT sha256, bytes FROM documents ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            for table in ("pages", "fields", "documents"):
+                connection.execute(f"DELETE FROM {table} WHERE sha256 = ?", (sha256,))
+            total -= size
+            evicted += 1
+        self._count("evicted", evicted)
+        logger.info(f"Extraction cache: evicted {evicted} documents to fit {self.max_bytes} bytes")
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        stored = {"documents": 0, "bytes": 0}
+        if self.enabled and os.path.exists(self.path):
+            try:
+                documents, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM documents"
+                ).fetchone()
+                stored = {"documents": documents, "bytes": size}
+            except sqlite3.Error as e:
+                self._error("read stats", e)
+        lookups = counts["hits"] + counts["page_hits"] + counts["misses"]
+        return {
+            "path": self.path or None,
+            "max_bytes": self.max_bytes,
+            **stored,
+            **counts,
+            "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class AuditSink:
+    """
+    Append extraction records to a JSON-lines file from a background thread
+
+    ``submit`` only enqueues, so auditing never slows an extraction down.
+    Each record is written with a single append, so several worker processes
+    can share one file. When the queue is full, records are dropped and
+    counted rather than blocking.
+    """
+
+    def __init__(self, path=EXTRACT_AUDIT_LOG, max_pending=1024):
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def submit(self, record):
+        if not self.enabled:
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Audit log queue is full, dropping an extraction record")
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="extract-audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                line = (json.dumps(record) + "\n").encode()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+                self.written += 1
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"Could not write audit record to {self.path}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every submitted record has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self):
+        return {"path": self.path or None, "written": self.written, "dropped": self.dropped,
+                "pending": self._queue.qsize()}
+
+
+extraction_cache = ExtractionCache()
+audit_sink = AuditSink()
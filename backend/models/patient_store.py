@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Default settings, overridable per deployment
+PATIENT_DB_PATH = os.environ.get("PATIENT_DB_PATH", os.path.join("data", "patients.sqlite3"))
+LEGACY_PATIENTS_FILE = os.environ.get("LEGACY_PATIENTS_FILE", os.path.join("data", "patients.json"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    dob TEXT,
+    phone TEXT,
+    email TEXT,
+    created_at TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patients_name ON patients (last_name COLLATE NOCASE, first_name COLLATE NOCASE, created_at);
+CREATE INDEX IF NOT EXISTS patients_phone ON patients (phone);
+CREATE INDEX IF NOT EXISTS patients_email ON patients (email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS patients_created_at ON patients (created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def new_patient_id(now=None):
+    """
+    Patient ID such as P20250307104616-9F2C41D7A03B6E15
+
+    Keeps the timestamp prefix of the old IDs, so they still sort by
+    creation time, plus 64 random bits, so even a million saves within one
+    second are unlikely to clash; the primary key catches a clash anyway
+    and ``add`` retries with a fresh ID.
+    """
+    now = now or datetime.now()
+    return f"P{now.strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(8).upper()}"
+
+
+class PatientStore:
+    """
+    Patient records in a SQLite database in WAL mode
+
+    Each save is one small indexed insert, so its cost does not grow with
+    the number of patients, and concurrent saves are serialized by SQLite
+    instead of overwriting each other. The full record is kept as JSON next
+    to the indexed columns used for lookups. On first use, records from the
+    old data/patients.json are imported once and the file is renamed to
+    patients.json.migrated.
+    """
+
+    def __init__(self, path=PATIENT_DB_PATH, legacy_file=LEGACY_PATIENTS_FILE):
+        self.path = path
+        self.legacy_file = legacy_file
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    def _connection(self):
+        # One connection per thread; the first one creates the tables and runs the migration
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._setup_lock:
+                if not self._ready:
+                    connection.executescript(SCHEMA)
+                    self._migrate_legacy(connection)
+                    self._ready = True
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row(record):
+        return (
+            record["id"],
+            record.get("firstName") or "",
+            record.get("lastName") or "",
+            record.get("dob"),
+            record.get("phone"),
+            record.get("email"),
+            record["createdAt"],
+            json.dumps(record),
+        )
+
+    def add(self, record, max_attempts=5):
+        """Save a new patient record and return its ID"""
+        connection = self._connection()
+        record = dict(record)
+        record["createdAt"] = datetime.now().isoformat()
+        for _ in range(max_attempts):
+            record["id"] = new_patient_id()
+            try:
+                connection.execute(
+                    "INSERT INTO patients (id, first_name, last_name, dob, phone, email, created_at, record)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._row(record)
+                )
+                return record["id"]
+            except sqlite3.IntegrityError:
+                logger.warning(f"Patient ID {record['id']} already exists, retrying with a new one")
+        raise RuntimeError(f"Could not allocate a unique patient ID after {max_attempts} attempts")
+
+    def add_many(self, records):
+        """Save many new records in one transaction (imports, benchmarks); returns their IDs"""
+        connection = self._connection()
+        created_at = datetime.now().isoformat()
+        rows = []
+        for record in records:
+            record = {**record, "id": new_patient_id(), "createdAt": created_at}
+            rows.append(self._row(record))
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT INTO patients (id, first_name, last_name, dob, phone, email, created_at, record)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return [row[0] for row in rows]
+
+    def get(self, patient_id):
+        row = self._connection().execute("SELECT record FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, last_name=None, first_name=None, phone=None, email=None, limit=50):
+        """Records matching every given field (names and email case-insensitively), newest first"""
+        clauses, params = [], []
+        for column, value, collate in (("last_name", last_name, " COLLATE NOCASE"),
+                                       ("first_name", first_name, " COLLATE NOCASE"),
+                                       ("phone", phone, ""),
+                                       ("email", email, " COLLATE NOCASE")):
+            if value is not None:
+                clauses.append(f"{column} = ?{collate}")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT record FROM patients {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    def _migrate_legacy(self, connection):
+        """Import data/patients.json once; records whose old ID was already taken get a new ID"""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+
+        start = time.perf_counter()
+        # The write lock is taken first, so only one worker process imports the file
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_migrated'").fetchone():
+                connection.execute("ROLLBACK")
+                return
+            try:
+                with open(self.legacy_file, "r") as f:
+                    records = json.load(f)
+            except json.JSONDecodeError as e:
+                # Leave the file in place to be fixed by hand; the API still starts without it
+                logger.error(f"Could not migrate {self.legacy_file}, it is not valid JSON: {str(e)}")
+                connection.execute("ROLLBACK")
+                return
+            if not isinstance(records, list):
+                logger.error(f"Could not migrate {self.legacy_file}, expected a list of patient records "
+                             f"but found {type(records).__name__}")
+                connection.execute("ROLLBACK")
+                return
+
+            migrated = reassigned = skipped = 0
+            for position, record in enumerate(records):
+                if not isinstance(record, dict):
+                    logger.warning(f"Skipping entry {position} of {self.legacy_file}: "
+                                   f"expected a patient record, found {type(record).__name__}")
+                    skipped += 1
+                    continue
+                record = dict(record)
+                record["createdAt"] = record.get("createdAt") or datetime.now().isoformat()
+                rekeyed = not record.get("id")
+                if rekeyed:
+                    record["id"] = new_patient_id()
+                # Second-resolution IDs could collide; keep the first and re-key the rest
+                try:
+                    while True:
+                        try:
+                            connection.execute(
+                                "INSERT INTO patients (id, first_name, last_name, dob, phone, email, created_at, record)"
+                                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                self._row(record)
+                            )
+                            break
+                        except sqlite3.IntegrityError:
+                            if not connection.execute("SELECT 1 FROM patients WHERE id = ?", (record["id"],)).fetchone():
+                                raise
+                            record.setdefault("legacyId", record["id"])
+                            record["id"] = new_patient_id()
+                            rekeyed = True
+                except sqlite3.ProgrammingError as e:
+                    # A field of a type SQLite cannot store, such as a list where a name should be
+                    logger.warning(f"Skipping entry {position} of {self.legacy_file}: {str(e)}")
+                    skipped += 1
+                    continue
+                migrated += 1
+                reassigned += rekeyed
+
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('legacy_json_migrated', ?)", (datetime.now().isoformat(),)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        os.replace(self.legacy_file, f"{self.legacy_file}.migrated")
+        logger.info(f"Migrated {migrated} patients from {self.legacy_file} ({reassigned} given new IDs, "
+                    f"{skipped} invalid entries skipped) in {time.perf_counter() - start:.2f}s")
+
+    def stats(self):
+        return {"path": self.path, "patients": self.count()}
+
+
+patient_store = PatientStore()
@@ -3,14 +3,42 @@ from torchvision import transforms
 from PIL import Image
 import torch.nn as nn
 from torchvision.models import densenet121, DenseNet121_Weights
+import io
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from models.batching import MicroBatcher
+from models.result_cache import ResultCache, content_key
 
 # Path to the model weights - update this to your actual path
 MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Dinil_model", "dense_weights.pth")
 
+# Exported ONNX models, produced by models/export_densenet.py
+ONNX_MODEL_PATH = os.path.splitext(MODEL_PATH)[0] + ".onnx"
+ONNX_INT8_MODEL_PATH = os.path.splitext(MODEL_PATH)[0] + ".int8.onnx"
+
+# Inference backend chosen at load time: "torch", "onnx" or "onnx-int8"
+BACKENDS = {
+    "torch": MODEL_PATH,
+    "onnx": ONNX_MODEL_PATH,
+    "onnx-int8": ONNX_INT8_MODEL_PATH,
+}
+BACKEND = os.environ.get("PHOTO_BACKEND", "torch")
+
+# ONNX Runtime intra-op threads (0 lets ONNX Runtime decide)
+ORT_THREADS = int(os.environ.get("PHOTO_ORT_THREADS", "0"))
+
 # Device configuration
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Dynamic batching settings: concurrent photos are stacked into one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("PHOTO_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("PHOTO_MAX_WAIT_MS", "10"))
+
+# Threads used to decode and preprocess the photos of a multi-photo request
+PREPROCESS_WORKERS = int(os.environ.get("PHOTO_PREPROCESS_WORKERS", str(min(8, os.cpu_count() or 1))))
+
 # Define the model class
 class CustomDenseNet(nn.Module):
     def __init__(self, num_classes):
@@ -23,24 +51,65 @@ class CustomDenseNet(nn.Module):
 
 # Initialize model (lazy loading)
 model = None
+
+# Load and warmup timings, filled in by preload()
+load_stats = {}
 class_labels = ['Calculus', 'Caries', 'Gingivitis', 'Hypodontia', 'Tooth Discoloration', 'Ulcers']
+class OnnxDenseNet:
+    """
+    ONNX Runtime session with the same call signature as CustomDenseNet
+
+    Takes a float32 batch tensor and returns the logits as a tensor, so the
+    batching code does not need to know which backend is active.
+    """
+
+    def __init__(self, onnx_path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ORT_THREADS > 0:
+            options.intra_op_num_threads = ORT_THREADS
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+def build_model(backend="torch", weights_path=None):
+    """Build the classifier for the given backend, from weights_path or the backend's default weights"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown photo backend '{backend}', expected one of {list(BACKENDS)}")
+
+    weights_path = weights_path or BACKENDS[backend]
+    if not os.path.exists(weights_path):
+        raise FileNotFoundError(f"Model weights not found at {weights_path}")
+
+    if backend != "torch":
+        print(f"ONNX model loaded ({backend}): {weights_path}")  # ✅ Debug log
+        return OnnxDenseNet(weights_path)
+
+    # Initialize model
+    num_classes = len(class_labels)
+    torch_model = CustomDenseNet(num_classes).to(device)
+
+    # Load weights
+    state_dict = torch.load(weights_path, map_location=device)
+    print(f"Model weights loaded: {weights_path}")  # ✅ Debug log
+    print("Model state dict keys:", state_dict.keys())  # ✅ Debug log
+    torch_model.load_state_dict(state_dict)
+    torch_model.eval()
+    return torch_model
+
 def load_model():
-    """Load the DenseNet model"""
+    """Load the DenseNet model with the configured backend"""
     global model
     if model is None:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model weights not found at {MODEL_PATH}")
-
-        # Initialize model
-        num_classes = len(class_labels)
-        model = CustomDenseNet(num_classes).to(device)
-
-        # Load weights
-        state_dict = torch.load(MODEL_PATH, map_location=device)
-        print(f"Model weights loaded: {MODEL_PATH}")  # ✅ Debug log
-        print("Model state dict keys:", state_dict.keys())  # ✅ Debug log
-        model.load_state_dict(state_dict)
-        model.eval()
+        model = build_model(BACKEND)
 
     return model
 
@@ -53,47 +122,185 @@ test_transform = transforms.Compose([
     transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
 ])
 
-def analyze_dental_photo(image_path):
-    try:
-        model = load_model()
-        
-        # Load and preprocess the image
-        image = Image.open(image_path).convert("RGB")
-        input_tensor = test_transform(image).unsqueeze(0).to(device)
-
-        # Make prediction
-        with torch.no_grad():
-            output = model(input_tensor)
-            probabilities = torch.nn.functional.softmax(output, dim=1)[0]
-
-        print(f"Raw model output: {output}")  # ✅ Debug log
-        print(f"Class probabilities: {probabilities.tolist()}")  # ✅ Debug log
-
-        predicted_class_idx = torch.argmax(probabilities).item()
-        confidence = float(probabilities[predicted_class_idx].item())
-
-        predicted_label = class_labels[predicted_class_idx]
-        severity = "High" if confidence > 0.8 else "Moderate" if confidence > 0.6 else "Low"
-        recommendations = get_recommendations_for_condition(predicted_label)
-
-        return {
-            "predicted_class": predicted_label,
-            "confidence": confidence,
-            "severity": severity,
-            "recommendations": recommendations,
-            "all_probabilities": {class_labels[i]: float(probabilities[i].item()) for i in range(len(class_labels))}
-        }
+def _classify_batch(input_tensors, classifier=None):
+    """
+    Run one forward pass over a batch of preprocessed images
+
+    Uses the configured model unless another ``classifier`` is given.
+    Returns one softmax probability row per input tensor, in order.
+    """
+    if classifier is None:
+        classifier = load_model()
+
+    batch = torch.stack(input_tensors).to(device)
+    with torch.no_grad():
+        output = classifier(batch)
+        probabilities = torch.nn.functional.softmax(output, dim=1).cpu()
+
+    return list(probabilities)
+
+def preload(warmup_runs=2):
+    """
+    Load the model and run warmup forward passes on synthetic inputs
+
+    Safe to call more than once; later calls only return the recorded timings.
+
+    Returns:
+        Dictionary with load and warmup timings
+    """
+    if model is not None and load_stats:
+        return load_stats
 
+    start = time.perf_counter()
+    load_model()
+    load_time = time.perf_counter() - start
+
+    # Warm up at the largest batch size the batcher will send
+    dummy = [torch.zeros(3, 128, 128) for _ in range(MAX_BATCH_SIZE)]
+    start = time.perf_counter()
+    for _ in range(warmup_runs):
+        _classify_batch(dummy)
+    warmup_time = time.perf_counter() - start
+
+    load_stats.update({
+        "backend": BACKEND,
+        "weights_path": BACKENDS.get(BACKEND, MODEL_PATH),
+        "device": str(device) if BACKEND == "torch" else "cpu",
+        "load_time_s": round(load_time, 3),
+        "warmup_runs": warmup_runs,
+        "warmup_time_s": round(warmup_time, 3),
+    })
+    print(f"Photo model ready: loaded in {load_time:.2f}s, {warmup_runs} warmup runs in {warmup_time:.2f}s")  # Debug log
+    return load_stats
+
+batcher = MicroBatcher(_classify_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name="photo")
+
+# Results keyed by hash of the image bytes and the active backend's weights file
+result_cache = ResultCache("photo")
+
+# Threads that decode and preprocess the photos of one request in parallel
+_preprocess_pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="photo-preprocess")
+
+def _read_image(image):
+    """Return the encoded bytes of an upload (bytes) or a file path"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    with open(image, "rb") as f:
+        return f.read()
+
+def _preprocess(image_bytes):
+    """Decode one encoded photo and turn it into a model input tensor"""
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return test_transform(image)
+
+def _result_from_probabilities(probabilities):
+    # One conversion to Python floats instead of an .item() call per class
+    probability_list = probabilities.tolist()
+    print(f"Class probabilities: {probability_list}")  # ✅ Debug log
+
+    predicted_class_idx = max(range(len(probability_list)), key=probability_list.__getitem__)
+    confidence = probability_list[predicted_class_idx]
+
+    predicted_label = class_labels[predicted_class_idx]
+    severity = "High" if confidence > 0.8 else "Moderate" if confidence > 0.6 else "Low"
+    recommendations = get_recommendations_for_condition(predicted_label)
+
+    return {
+        "predicted_class": predicted_label,
+        "confidence": confidence,
+        "severity": severity,
+        "recommendations": recommendations,
+        "all_probabilities": dict(zip(class_labels, probability_list))
+    }
+
+def _error_result(error):
+    print(f"Error in analyze_dental_photo: {str(error)}")
+    return {
+        "predicted_class": "Analysis Error",
+        "confidence": 0.0,
+        "severity": "Unknown",
+        "recommendations": "Error analyzing the image. Please try again with a different image.",
+        "error": str(error)
+    }
+
+def _failed(error):
+    future = Future()
+    future.set_exception(error)
+    return future
+
+def _complete(owner, probabilities_future):
+    """Resolve a cache-owned future from the batcher's probabilities"""
+    try:
+        owner.set_result(_result_from_probabilities(probabilities_future.result()))
     except Exception as e:
-        print(f"Error in analyze_dental_photo: {str(e)}")
-        return {
-            "predicted_class": "Analysis Error",
-            "confidence": 0.0,
-            "severity": "Unknown",
-            "recommendations": "Error analyzing the image. Please try again with a different image.",
-            "error": str(e)
-        }
+        owner.set_exception(e)
+
+def analyze_dental_photos(images):
+    """
+    Classify several dental photos with as few forward passes as possible
+
+    Photos already in the result cache are answered directly. The rest are
+    decoded and preprocessed in parallel, then submitted to the batcher
+    together so they share one forward pass (up to PHOTO_MAX_BATCH_SIZE).
+
+    Args:
+        images: Encoded image bytes or paths
+
+    Returns:
+        One result dictionary per photo, in order; failed photos get an
+        "Analysis Error" result instead of failing the whole request
+    """
+    futures = []
+    pending = []
+    for image in images:
+        try:
+            image_bytes = _read_image(image)
+            key = content_key(image_bytes, BACKENDS.get(BACKEND, MODEL_PATH), BACKEND)
+        except Exception as e:
+            futures.append(_failed(e))
+            continue
+
+        # Repeated uploads of the same photo are served from the cache
+        owner = Future()
+        future, started = result_cache.get_or_start(key, lambda owner=owner: owner)
+        futures.append(future)
+        if started:
+            pending.append((image_bytes, owner))
+
+    # Decode and preprocess the new photos in parallel
+    preprocessed = [_preprocess_pool.submit(_preprocess, image_bytes) for image_bytes, _ in pending]
+    inputs = []
+    for (_, owner), tensor_future in zip(pending, preprocessed):
+        try:
+            inputs.append((tensor_future.result(), owner))
+        except Exception as e:
+            owner.set_exception(e)
+
+    # Submit back to back so the batcher stacks them into one forward pass
+    for tensor, owner in inputs:
+        probabilities_future = batcher.submit(tensor)
+        probabilities_future.add_done_callback(lambda done, owner=owner: _complete(owner, done))
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(_error_result(e))
+    return results
+
+def analyze_dental_photo(image):
+    """
+    Classify one dental photo
+
+    Args:
+        image: Encoded image bytes or a path to the photo
 
+    Returns:
+        Dictionary with the predicted class, confidence, severity,
+        recommendations and all class probabilities
+    """
+    return analyze_dental_photos([image])[0]
 
 def get_recommendations_for_condition(condition: str) -> str:
     """Return recommendations based on dental condition"""
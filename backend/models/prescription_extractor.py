@@ -1,76 +1,289 @@
 import os
+import io
 import re
-import pickle
+import json
+import hashlib
+import pypdf
 from pypdf import PdfReader
+import time
 import tempfile
 import logging
+from datetime import datetime
+
+from models.extraction_cache import extraction_cache, audit_sink
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_medical_data(pdf_path):
+# Field label patterns, matched case-insensitively; the first match in the text wins
+FIELD_PATTERNS = {
+    "Name": r"Patient Name:\s*(.*)",
+    "Age": r"Age:\s*(\d+)",
+    "Gender": r"Gender:\s*(.*)",
+    "Blood Group": r"Blood Group:\s*(.*)",
+    "Allergies": r"Allergies:\s*(.*)",
+    "Existing Conditions": r"Existing Conditions:\s*(.*)",
+    "Current Medications": r"Current Medications:\s*(.*)",
+    "Doctor's Notes": r"Doctor's Notes:\s*(.*)",
+    "Previous Dental Procedures": r"Previous Dental Procedures:\s*(.*)",
+}
+
+# Other common name patterns, tried in order when "Patient Name:" gives nothing
+NAME_FALLBACK_PATTERNS = [
+    r"Name:\s*(.*)",
+    r"Patient:\s*(.*)",
+    r"Patient Information\s*\n\s*(.*)",
+    r"PATIENT NAME:\s*(.*)"
+]
+
+# Lazy page scanning: stop once these fields are found, after EXTRACT_MAX_PAGES pages,
+# or once EXTRACT_TIME_BUDGET_S has passed (0 disables the cap or the budget). By default
+# only the fields that identify the patient are required, since records often leave the
+# others out; EXTRACT_REQUIRED_FIELDS is a comma-separated list of FIELD_PATTERNS keys
+REQUIRED_FIELDS = [field.strip() for field in os.environ.get("EXTRACT_REQUIRED_FIELDS", "Name,Age").split(",")
+                   if field.strip()]
+MAX_PAGES = int(os.environ.get("EXTRACT_MAX_PAGES", "20"))
+TIME_BUDGET_S = float(os.environ.get("EXTRACT_TIME_BUDGET_S", "5"))
+
+# Bump when extraction changes in a way the settings below do not capture; cached results are keyed by it
+EXTRACTOR_VERSION = "2"
+TEXT_VERSION = f"pypdf-{pypdf.__version__}"
+FIELDS_VERSION = hashlib.sha256(json.dumps(
+    [EXTRACTOR_VERSION, FIELD_PATTERNS, NAME_FALLBACK_PATTERNS, REQUIRED_FIELDS, MAX_PAGES]
+).encode()).hexdigest()[:16]
+
+_FIELD_REGEXES = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in FIELD_PATTERNS.items()}
+_NAME_FALLBACK_REGEXES = [re.compile(pattern, re.IGNORECASE) for pattern in NAME_FALLBACK_PATTERNS]
+
+def extract_medical_data(pdf_path, save=True):
     """
     Extract structured medical details from a PDF file
     
+    Pages are parsed one at a time and parsing stops once the required
+    fields (REQUIRED_FIELDS) are found, or at the page cap or time budget
+    (see ``scan_pdf_fields``); other fields that only appear on later pages
+    are then left empty. Results are cached by the sha256 of the PDF bytes,
+    so re-uploading the same document skips parsing (see
+    models/extraction_cache.py).
+
     Args:
         pdf_path: Path to the PDF file
+        save: Also send the record to the audit log, if EXTRACT_AUDIT_LOG is set
         
     Returns:
-        Dictionary with extracted medical data
+        Dictionary with extracted medical data, plus an "extraction" entry
+        reporting how many pages were parsed, why parsing stopped and
+        whether the result came from the cache
     """
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"File not found: {pdf_path}")
 
-    try:
-        pdf_reader = PdfReader(pdf_path)
-        text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-        
-        # Log the extracted text for debugging
-        logger.info(f"Extracted text from PDF: {text[:200]}...")  # Log first 200 chars
-    except Exception as e:
-        logger.error(f"Error reading PDF: {str(e)}")
-        raise ValueError(f"Error reading PDF: {str(e)}")
-
-    # Extract structured details using regex
-    patient_info = {
-        "Name": extract_field(text, r"Patient Name:\s*(.*)", ""),
-        "Age": extract_field(text, r"Age:\s*(\d+)", ""),
-        "Gender": extract_field(text, r"Gender:\s*(.*)", ""),
-        "Blood Group": extract_field(text, r"Blood Group:\s*(.*)", ""),
-        "Allergies": extract_field(text, r"Allergies:\s*(.*)", ""),
-        "Existing Conditions": extract_field(text, r"Existing Conditions:\s*(.*)", ""),
-        "Current Medications": extract_field(text, r"Current Medications:\s*(.*)", ""),
-        "Doctor's Notes": extract_field(text, r"Doctor's Notes:\s*(.*)", ""),
-        "Previous Dental Procedures": extract_field(text, r"Previous Dental Procedures:\s*(.*)", ""),
-    }
-    
-    # If no name was found, try alternative patterns
-    if not patient_info["Name"]:
-        # Try other common patterns
-        name_patterns = [
-            r"Name:\s*(.*)",
-            r"Patient:\s*(.*)",
-            r"Patient Information\s*\n\s*(.*)",
-            r"PATIENT NAME:\s*(.*)"
-        ]
-        
-        for pattern in name_patterns:
-            name = extract_field(text, pattern, "")
-            if name:
-                patient_info["Name"] = name
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    document_hash = hashlib.sha256(data).hexdigest()
+
+    cached = extraction_cache.get_fields(document_hash, FIELDS_VERSION)
+    if cached is not None:
+        patient_info, extraction = cached
+        # Report what this call cost: no pages parsed, only the read, hash and cache lookup
+        extraction = {
+            **extraction,
+            "pages_parsed": 0,
+            "pages_cached": extraction["pages_parsed"] + extraction.get("pages_cached", 0),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "cached": True,
+        }
+        logger.info(f"Extraction cache hit for {document_hash[:12]}: {patient_info}")
+    else:
+        try:
+            # Pages parsed for an earlier extractor version are reused instead of parsed again
+            cached_pages, pages_total = extraction_cache.get_pages(document_hash, TEXT_VERSION)
+            scanner, extraction, page_texts = scan_pdf_fields(io.BytesIO(data), cached_pages=cached_pages,
+                                                              pages_total=pages_total)
+
+            # Log the extracted text for debugging
+            logger.info(f"Extracted text from PDF: {scanner.text[:200]}...")  # Log first 200 chars
+        except Exception as e:
+            logger.error(f"Error reading PDF: {str(e)}")
+            raise ValueError(f"Error reading PDF: {str(e)}")
+
+        # Structured details, matched as the pages were read
+        patient_info = scanner.result()
+
+        # Log the extracted info
+        logger.info(f"Extracted patient info: {patient_info}")
+        logger.info(f"Parsed {extraction['pages_parsed']}/{extraction['pages_total']} pages, stopped: {extraction['stopped']}")
+
+        # If still no name found, don't default to "John Doe"
+        if not patient_info["Name"]:
+            patient_info["Name"] = ""  # Empty string instead of default
+
+        # A result cut short by the time budget may be incomplete, so it is not cached
+        if extraction["stopped"] != "time_budget":
+            extraction_cache.put(document_hash, FIELDS_VERSION, TEXT_VERSION, page_texts, extraction["pages_total"],
+                                 patient_info, extraction)
+        extraction = {**extraction, "cached": False}
+
+    # Keep an audit trail of extracted records, written in the background
+    if save:
+        audit_sink.submit({"time": datetime.now().isoformat(), "sha256": document_hash,
+                           "file": os.path.basename(pdf_path), "fields": patient_info})
+
+    return {**patient_info, "extraction": extraction}
+
+def read_pdf_text(pdf_path):
+    """Text of all non-empty pages, each page parsed once"""
+    pdf_reader = PdfReader(pdf_path)
+    page_texts = [page.extract_text() for page in pdf_reader.pages]
+    return "\n".join(page_text for page_text in page_texts if page_text)
+
+def scan_pdf_fields(pdf, required_fields=REQUIRED_FIELDS, max_pages=MAX_PAGES, time_budget_s=TIME_BUDGET_S,
+                    cached_pages=(), pages_total=None):
+    """
+    Parse pages lazily into a FieldScanner until the required fields are found
+
+    ``pdf`` is a path or a binary file object. ``cached_pages`` are the texts
+    of the first pages from an earlier parse (``pages_total`` pages in all,
+    if known); they are scanned without touching the PDF, which is only
+    opened if more pages are needed.
+
+    Stops early at ``max_pages`` pages or once ``time_budget_s`` has passed
+    (0 disables either); at least one page is always scanned. Returns the
+    scanner, {"pages_parsed", "pages_cached", "pages_total", "stopped",
+    "elapsed_ms"} and the texts of every page scanned, where "stopped" is
+    "fields_found", "page_cap", "time_budget" or "end".
+    """
+    start = time.perf_counter()
+    scanner = FieldScanner()
+    page_texts = []
+    pdf_reader = None
+    stopped = "end"
+    while True:
+        page_no = len(page_texts)
+        if page_no and scanner.has_fields(required_fields):
+            stopped = "fields_found"
+            break
+        if max_pages and page_no >= max_pages:
+            stopped = "page_cap"
+            break
+        if time_budget_s and page_no and time.perf_counter() - start >= time_budget_s:
+            stopped = "time_budget"
+            break
+
+        if page_no < len(cached_pages):
+            page_text = cached_pages[page_no]
+        else:
+            if pdf_reader is None and (pages_total is None or page_no < pages_total):
+                pdf_reader = PdfReader(pdf)
+                pages_total = len(pdf_reader.pages)
+            if page_no >= pages_total:
                 break
-    
-    # Log the extracted info
-    logger.info(f"Extracted patient info: {patient_info}")
-    
-    # If still no name found, don't default to "John Doe"
-    if not patient_info["Name"]:
-        patient_info["Name"] = ""  # Empty string instead of default
-    
-    # Save a copy of the extracted data (for debugging/reference)
-    save_data(patient_info)
+            page_text = pdf_reader.pages[page_no].extract_text() or ""
+        scanner.feed(page_text)
+        page_texts.append(page_text)
+    scanner.finish()
+
+    pages_cached = min(len(cached_pages), len(page_texts))
+    return scanner, {
+        "pages_parsed": len(page_texts) - pages_cached,
+        "pages_cached": pages_cached,
+        "pages_total": pages_total,
+        "stopped": stopped,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }, page_texts
+
+class FieldScanner:
+    """
+    Field matcher over text that arrives one page at a time
+
+    Pages are joined with newlines and empty pages skipped, as in
+    ``read_pdf_text``. Each new page is searched with the precompiled
+    patterns of the fields still missing, together with the last non-blank
+    line before it, where a label whose value is on the next page can
+    begin; every field therefore gets the same first match ``re.search``
+    would find on the joined text. A match whose value is still empty at
+    the end of the text is only kept by ``finish``, because until then the
+    value may start on the next page.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.found = {}
+        self._window = ""  # Last non-blank line before the newest page, then the newest page
+
+    @property
+    def text(self):
+        return "\n".join(self.pages)
+
+    def feed(self, page_text):
+        if not page_text:
+            return
+        if self.pages:
+            last_line = self._window.rstrip().rfind("\n") + 1
+            self._window = f"{self._window[last_line:]}\n{page_text}"
+        else:
+            self._window = page_text
+        self.pages.append(page_text)
+        self._match(final=False)
 
+    def finish(self):
+        """Keep the matches still waiting for more text"""
+        self._match(final=True)
+
+    def _match(self, final):
+        for field, regex in _FIELD_REGEXES.items():
+            if field not in self.found:
+                self._search(field, regex, final)
+        # The fallbacks only matter while "Patient Name:" has given nothing
+        if not self.found.get("Name"):
+            for i, regex in enumerate(_NAME_FALLBACK_REGEXES):
+                if ("name", i) not in self.found:
+                    self._search(("name", i), regex, final)
+
+    def _search(self, key, regex, final):
+        # Patterns are unanchored, so searching the window finds what searching the joined text from its start would
+        match = regex.search(self._window)
+        if match and (match.group(1) or final):
+            self.found[key] = match.group(1).strip()
+
+    def has_fields(self, fields):
+        """True once every field has its final value; a name must be non-empty, from "Patient Name:" or a fallback"""
+        return all(self.has_name() if field == "Name" else field in self.found for field in fields)
+
+    def has_name(self):
+        if self.found.get("Name"):
+            return True
+        return any(self.found.get(("name", i)) for i in range(len(_NAME_FALLBACK_REGEXES)))
+
+    def result(self):
+        logger.debug("Matched fields: %s", self.found)
+        patient_info = {field: self.found.get(field, "") for field in FIELD_PATTERNS}
+
+        # If no name was found, use the first alternative pattern that gives one
+        if not patient_info["Name"]:
+            for i in range(len(_NAME_FALLBACK_REGEXES)):
+                name = self.found.get(("name", i))
+                if name:
+                    patient_info["Name"] = name
+                    break
+        return patient_info
+
+def extract_fields(text):
+    """Match every field with its precompiled pattern; same values as one ``extract_field`` per pattern"""
+    patient_info = {}
+    for field, regex in _FIELD_REGEXES.items():
+        match = regex.search(text)
+        patient_info[field] = match.group(1).strip() if match else ""
+
+    # If no name was found, use the first alternative pattern that gives one
+    if not patient_info["Name"]:
+        for regex in _NAME_FALLBACK_REGEXES:
+            match = regex.search(text)
+            if match and match.group(1).strip():
+                patient_info["Name"] = match.group(1).strip()
+                break
     return patient_info
 
 def extract_field(text, pattern, default=""):
@@ -86,15 +299,6 @@ def extract_field(text, pattern, default=""):
         logger.debug(f"Failed to extract using pattern '{pattern}'")
         return default
 
-def save_data(patient_info, file_name="medical_record.pkl"):
-    """Save structured patient records for reference"""
-    # Create directory if it doesn't exist
-    os.makedirs("data", exist_ok=True)
-    
-    file_path = os.path.join("data", file_name)
-    with open(file_path, "wb") as f:
-        pickle.dump(patient_info, f)
-
 # For testing
 if __name__ == "__main__":
     # Test with a sample PDF
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Default settings, overridable per deployment
+CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")  # Unset disables the on-disk tier
+CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", str(24 * 3600)))
+
+_MISSING = object()
+
+# sha256 of each weights file, keyed by (path, size, mtime) so it is hashed once per deploy
+_weights_hashes = {}
+_weights_lock = threading.Lock()
+
+
+def weights_fingerprint(path):
+    """Return the sha256 of a model weights file, recomputed only when the file changes"""
+    stat = os.stat(path)
+    signature = (path, stat.st_size, stat.st_mtime_ns)
+    with _weights_lock:
+        digest = _weights_hashes.get(signature)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _weights_lock:
+            _weights_hashes[signature] = digest
+    return digest
+
+
+def content_key(data, weights_path, *extra):
+    """Cache key for a piece of content analyzed with the given weights file"""
+    sha = hashlib.sha256(data)
+    sha.update(weights_fingerprint(weights_path).encode())
+    for part in extra:
+        sha.update(str(part).encode())
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache for analysis results
+
+    Two tiers: a bounded in-memory LRU and an optional on-disk JSON store whose
+    entries expire after ``ttl_seconds``. Concurrent requests for the same key
+    share one computation (single flight). Cached values are shared between
+    callers and must be treated as read-only.
+    """
+
+    def __init__(self, name, max_entries=CACHE_SIZE, disk_dir=CACHE_DIR, ttl_seconds=CACHE_TTL):
+        self.name = name
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "shared": 0, "misses": 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # Memory tier
+    def _get_memory(self, key):
+        value = self._memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._memory.move_to_end(key)
+        return value
+
+    def _put_memory(self, key, value):
+        if self.max_entries == 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # Disk tier
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _get_disk(self, key):
+        if not self.disk_dir:
+            return _MISSING
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return _MISSING
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+
+    def _put_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"{self.name} cache: could not write {path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_or_start(self, key, start):
+        """
+        Return a future for ``key`` and whether this call started the work
+
+        On a hit the future is already resolved; if the same key is already
+        being computed the in-flight future is shared. Otherwise ``start()`` is
+        called and must return a future, whose result is cached on success.
+        """
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not _MISSING:
+                self._counts["memory_hits"] += 1
+                return _resolved(value), False
+            if key in self._inflight:
+                self._counts["shared"] += 1
+                return self._inflight[key], False
+            future = Future()
+            self._inflight[key] = future
+
+        value = self._get_disk(key)
+        if value is not _MISSING:
+            self._finish(key, future, value, store_disk=False)
+            with self._lock:
+                self._counts["disk_hits"] += 1
+            return future, False
+
+        with self._lock:
+            self._counts["misses"] += 1
+        try:
+            inner = start()
+        except Exception as e:
+            self._fail(key, future, e)
+            return future, True
+
+        def on_done(done):
+            error = done.exception()
+            if error is not None:
+                self._fail(key, future, error)
+            else:
+                self._finish(key, future, done.result())
+
+        inner.add_done_callback(on_done)
+        return future, True
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, calling ``compute()`` at most once across concurrent callers"""
+        def start():
+            future = Future()
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        future, _ = self.get_or_start(key, start)
+        return future.result()
+
+    def _finish(self, key, future, value, store_disk=True):
+        if store_disk:
+            self._put_disk(key, value)
+        with self._lock:
+            self._put_memory(key, value)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def _fail(self, key, future, error):
+        # Failures are never cached; the next request retries
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_exception(error)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self._counts.values())
+            hits = self._counts["memory_hits"] + self._counts["disk_hits"] + self._counts["shared"]
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_dir": self.disk_dir,
+                **self._counts,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
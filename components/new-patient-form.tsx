@@ -150,9 +150,8 @@ export default function NewPatientForm() {
 
         const data = await response.json(); // Get JSON response
 
-        // ✅ Set the correct image path (served by FastAPI)
-        const imageUrl = "http://localhost:8000/static/temp/output.jpg";  
-        setXrayResultImage(imageUrl);
+        // ✅ Each analysis gets its own annotated image URL (served by FastAPI)
+        setXrayResultImage(data.image_url);
 
         // ✅ Store analysis details (detections)
         setXrayAnalysisDetails(data.detections);